@@ -4,6 +4,6 @@
 # http://www.cdcotton.com
 # PYTHON_PREAMBLE_END:}}}
 
-import mysubmodules_func
+from mysubmodules import cli
 
-mysubmodules_func.allmodulesinfolder_ap(urlpathstart = 'https://github.com/c-d-cotton/', urlpathend = '.git')
+cli.main(urlpathstart = 'https://github.com/c-d-cotton/', urlpathend = '.git')
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+import datetime
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mysubmodules import core
+
+# Scan Backends:{{{1
+def benchmarkscanbackends(modulepaths, submoduleids = ['submodules', 'submodules2'], scanbackends = ['python', 'gitgrep'], repeats = 3):
+    """
+    Time getsubmodulesmulti with each scan backend on each module in modulepaths.
+    Raise an error if the backends do not give identical output.
+
+    Return a list of [modulepath, scanbackend, best time in seconds].
+    """
+    results = []
+    for modulepath in modulepaths:
+        outputs = {}
+        for scanbackend in scanbackends:
+            times = []
+            for i in range(repeats):
+                starttime = time.perf_counter()
+                outputs[scanbackend] = core.getsubmodulesmulti(modulepath, submoduleids = submoduleids, scanbackend = scanbackend)
+                times.append(time.perf_counter() - starttime)
+            results.append([modulepath, scanbackend, min(times)])
+
+        for scanbackend in scanbackends[1: ]:
+            if outputs[scanbackend] != outputs[scanbackends[0]]:
+                raise ValueError('Scan backends give different output: Modulepath: ' + modulepath + '. Backends: ' + scanbackends[0] + ', ' + scanbackend + '.')
+
+    return(results)
+
+
+def printbenchmarkscanbackends(modulepaths, repeats = 3):
+    results = benchmarkscanbackends(modulepaths, repeats = repeats)
+    for modulepath, scanbackend, besttime in results:
+        print(modulepath + ': ' + scanbackend + ': ' + '{:.4f}'.format(besttime) + 's.')
+
+
+# Synthetic Workspace:{{{1
+def makesyntheticworkspace(rootfolder, modulecount = 20, fanout = 3, depth = 3, filespermodule = 20, filesize = 2000, referencedensity = 0.2, submodules2fraction = 0.3, seed = 0):
+    """
+    Make modulecount git projects in rootfolder that refer to each other with submodules/NAME/ and submodules2/NAME/.
+
+    The modules are split into depth levels and each module refers to up to fanout modules in the levels below it so there are no cycles.
+    Each reference is to submodules2 with probability submodules2fraction and otherwise to submodules.
+    Each module has filespermodule files of about filesize bytes. The fraction referencedensity of the files contain references (at least one file if the module has any).
+    The modules in the top level are the projects.
+
+    Return [projects, submodulepathdict] where projects are the paths of the projects and submodulepathdict gives the path of every module.
+    """
+    rng = random.Random(seed)
+
+    modulenames = ['m' + str(i).zfill(len(str(modulecount))) for i in range(modulecount)]
+    levels = [i * depth // modulecount for i in range(modulecount)]
+
+    submodulepathdict = {}
+    projects = []
+    filler = 'Some text to fill this file.\n'
+    for i, modulename in enumerate(modulenames):
+        modulepath = os.path.join(rootfolder, modulename) + '/'
+        os.makedirs(modulepath)
+        submodulepathdict[modulename] = modulepath
+        if levels[i] == 0:
+            projects.append(modulepath)
+
+        # modules this module refers to
+        below = [modulenames[j] for j in range(modulecount) if levels[j] > levels[i]]
+        references = []
+        for submodule in rng.sample(below, min(fanout, len(below))):
+            if rng.random() < submodules2fraction:
+                references.append('submodules2/' + submodule + '/')
+            else:
+                references.append('submodules/' + submodule + '/')
+
+        referencefiles = max(int(filespermodule * referencedensity), min(1, len(references)))
+        for filenumber in range(filespermodule):
+            lines = []
+            if filenumber < referencefiles:
+                # spread the references over the files that have them
+                for reference in references[filenumber: : referencefiles]:
+                    lines.append('path = \'' + reference + 'file.py\'\n')
+            text = ''.join(lines)
+            text = text + filler * max(0, (filesize - len(text)) // len(filler))
+            with open(os.path.join(modulepath, 'file' + str(filenumber) + '.py'), 'w') as f:
+                f.write(text)
+
+        subprocess.check_call(['git', 'init', '--quiet'], cwd = modulepath)
+        subprocess.check_call(['git', 'add', '-A'], cwd = modulepath)
+        subprocess.check_call(['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@example.com', 'commit', '--quiet', '-m', 'Synthetic module.'], cwd = modulepath)
+
+    return(projects, submodulepathdict)
+
+
+def removesubmodulesfolders(projects):
+    for modulepath in projects:
+        for name in ['submodules', 'submodules2']:
+            if os.path.lexists(os.path.join(modulepath, name)):
+                core.rmrecursive(os.path.join(modulepath, name))
+
+
+# Suite:{{{1
+def benchmarksuite(rootfolder, syncbackend = core.syncbackend_default, repeats = 3):
+    """
+    Time getsubmodules, getsubmodulesall, addlocalsubmodules_full and dosubmodules_local on the workspace in rootfolder made by makesyntheticworkspace.
+
+    Cold is the first run with no submodules folders, scan cache or stamps (the files may still be in the operating system's cache).
+    Warm is the best of repeats runs straight afterwards reusing the submodules folders, scan cache and stamps.
+
+    Raise an error if any submodules fail to be added or syncbackend is 'rsync' and rsync isn't installed so I never record timings for runs that didn't work.
+
+    Return a list of [function, 'cold' or 'warm', time in seconds].
+    """
+    if syncbackend == 'rsync' and shutil.which('rsync') is None:
+        raise ValueError('rsync is not installed so use syncbackend native.')
+
+    modulenames = sorted(os.listdir(rootfolder))
+    modulenames = [modulename for modulename in modulenames if os.path.isdir(os.path.join(rootfolder, modulename, '.git'))]
+    submodulepathdict = {modulename: os.path.join(rootfolder, modulename) + '/' for modulename in modulenames}
+    # the projects are the modules no other module refers to
+    referenced = set()
+    for modulename in modulenames:
+        submodulesdict = core.getsubmodulesmulti(submodulepathdict[modulename])
+        referenced.update(submodulesdict['submodules'] + submodulesdict['submodules2'])
+    projects = [submodulepathdict[modulename] for modulename in modulenames if modulename not in referenced]
+
+    scancachefile = os.path.join(tempfile.mkdtemp(), 'scancache.json')
+
+    def runfunc(name):
+        if name == 'getsubmodules':
+            for modulepath in submodulepathdict.values():
+                core.getsubmodules(modulepath)
+        elif name == 'getsubmodulesall':
+            core.getsubmodulesall(projects, submodulepathdict, modulescansearchlist = modulenames, scancache = scancache)
+        elif name == 'addlocalsubmodules_full':
+            failures = core.addlocalsubmodules_full(projects, submodulepathdict, modulescansearchlist = modulenames, usestamps = True, syncbackend = syncbackend, scancachefile = scancachefile)
+            if len(failures) > 0:
+                raise ValueError('addlocalsubmodules_full failed: ' + str(failures) + '.')
+        elif name == 'dosubmodules_local':
+            failures = core.dosubmodules_local(projects, submodulepathdict, usestamps = True, syncbackend = syncbackend, scancachefile = scancachefile)
+            if len(failures) > 0:
+                raise ValueError('dosubmodules_local failed: ' + str(failures) + '.')
+
+    results = []
+    try:
+        for name in ['getsubmodules', 'getsubmodulesall', 'addlocalsubmodules_full', 'dosubmodules_local']:
+            removesubmodulesfolders(projects)
+            if os.path.isfile(scancachefile):
+                os.remove(scancachefile)
+            scancache = core.loadscancache(None)
+
+            starttime = time.perf_counter()
+            runfunc(name)
+            results.append([name, 'cold', time.perf_counter() - starttime])
+
+            times = []
+            for i in range(repeats):
+                starttime = time.perf_counter()
+                runfunc(name)
+                times.append(time.perf_counter() - starttime)
+            results.append([name, 'warm', min(times)])
+    finally:
+        removesubmodulesfolders(projects)
+        shutil.rmtree(os.path.dirname(scancachefile))
+
+    return(results)
+
+
+def recordbenchmarksuite(results, settings, outputfile = None):
+    """
+    Print results from benchmarksuite and add them to the end of outputfile (by default bench_output.txt in this project) with the date, the git revision of this project and settings so changes show up over time.
+    """
+    if outputfile is None:
+        outputfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_output.txt')
+
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode('ascii').strip()
+    except (subprocess.CalledProcessError, OSError):
+        revision = 'unknown'
+
+    lines = [str(datetime.datetime.now()) + ': Revision: ' + revision + '. Settings: ' + ', '.join(key + '=' + str(settings[key]) for key in sorted(settings)) + '.']
+    for name, runtype, seconds in results:
+        lines.append(name + ': ' + runtype + ': ' + '{:.4f}'.format(seconds) + 's.')
+
+    print('\n'.join(lines))
+    with open(outputfile, 'a') as f:
+        f.write('\n'.join(lines) + '\n\n')
+
+
+def runbenchmarksuite(modulecount = 20, fanout = 3, depth = 3, filespermodule = 20, filesize = 2000, referencedensity = 0.2, submodules2fraction = 0.3, seed = 0, syncbackend = core.syncbackend_default, repeats = 3, outputfile = None):
+    """
+    Make a synthetic workspace in a temporary folder, run benchmarksuite on it and record the results (see recordbenchmarksuite).
+    """
+    settings = {'modulecount': modulecount, 'fanout': fanout, 'depth': depth, 'filespermodule': filespermodule, 'filesize': filesize, 'referencedensity': referencedensity, 'submodules2fraction': submodules2fraction, 'seed': seed, 'syncbackend': syncbackend, 'repeats': repeats}
+
+    rootfolder = tempfile.mkdtemp()
+    try:
+        makesyntheticworkspace(rootfolder, modulecount = modulecount, fanout = fanout, depth = depth, filespermodule = filespermodule, filesize = filesize, referencedensity = referencedensity, submodules2fraction = submodules2fraction, seed = seed)
+        results = benchmarksuite(rootfolder, syncbackend = syncbackend, repeats = repeats)
+    finally:
+        core.rmrecursive(rootfolder)
+
+    recordbenchmarksuite(results, settings, outputfile = outputfile)
+    return(results)
+
+
+# Startup:{{{1
+def benchmarkstartup(repeats = 10):
+    """
+    Time starting Python and importing mysubmodules in a new process in the ways it is used from the command line.
+    The time for python -c pass is included so the time for Python itself can be taken off the others.
+
+    Return a list of [command, 'startup', best time in seconds].
+    """
+    projectdir = os.path.dirname(os.path.abspath(__file__))
+    commands = [
+        ['-c', 'pass'],
+        ['-c', 'import mysubmodules'],
+        ['-c', 'import mysubmodules.core'],
+        ['-c', 'import mysubmodules_func'],
+        ['-m', 'mysubmodules', '--help'],
+    ]
+
+    results = []
+    for command in commands:
+        times = []
+        for i in range(repeats):
+            starttime = time.perf_counter()
+            subprocess.check_call([sys.executable] + command, cwd = projectdir, stdout = subprocess.DEVNULL)
+            times.append(time.perf_counter() - starttime)
+        results.append(['python ' + ' '.join(command), 'startup', min(times)])
+
+    return(results)
+
+
+def runbenchmarkstartup(repeats = 10, outputfile = None):
+    """
+    Run benchmarkstartup and record the results (see recordbenchmarksuite).
+    """
+    results = benchmarkstartup(repeats = repeats)
+    recordbenchmarksuite(results, {'startup': True, 'repeats': repeats, 'python': sys.version.split()[0]}, outputfile = outputfile)
+    return(results)
+
+
+# Run:{{{1
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the scan backends on modulepaths, with --suite time the main functions on a synthetic workspace or with --startup time importing mysubmodules.')
+    parser.add_argument('modulepaths', nargs = '*', help = 'Modules to benchmark the scan backends on. By default this project.')
+    parser.add_argument('--suite', action = 'store_true', help = 'Run the suite on a synthetic workspace and add the results to bench_output.txt.')
+    parser.add_argument('--startup', action = 'store_true', help = 'Time starting Python and importing mysubmodules in a new process and add the results to bench_output.txt.')
+    parser.add_argument('--modulecount', type = int, default = 20)
+    parser.add_argument('--fanout', type = int, default = 3)
+    parser.add_argument('--depth', type = int, default = 3)
+    parser.add_argument('--filespermodule', type = int, default = 20)
+    parser.add_argument('--filesize', type = int, default = 2000)
+    parser.add_argument('--referencedensity', type = float, default = 0.2)
+    parser.add_argument('--submodules2fraction', type = float, default = 0.3)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--syncbackend', default = core.syncbackend_default, choices = ['rsync', 'native'])
+    parser.add_argument('--repeats', type = int, help = 'Default: 3 for --suite and 10 for --startup.')
+    parser.add_argument('--outputfile', help = 'Where to add the suite results. By default bench_output.txt in this project.')
+    args = parser.parse_args()
+
+    if args.startup is True:
+        if args.repeats is not None:
+            repeats = args.repeats
+        else:
+            repeats = 10
+        runbenchmarkstartup(repeats = repeats, outputfile = args.outputfile)
+    elif args.suite is True:
+        if args.repeats is not None:
+            repeats = args.repeats
+        else:
+            repeats = 3
+        runbenchmarksuite(modulecount = args.modulecount, fanout = args.fanout, depth = args.depth, filespermodule = args.filespermodule, filesize = args.filesize, referencedensity = args.referencedensity, submodules2fraction = args.submodules2fraction, seed = args.seed, syncbackend = args.syncbackend, repeats = repeats, outputfile = args.outputfile)
+    else:
+        if len(args.modulepaths) > 0:
+            modulepaths = args.modulepaths
+        else:
+            modulepaths = [os.path.dirname(os.path.abspath(__file__))]
+        printbenchmarkscanbackends(modulepaths)
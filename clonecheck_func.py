@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from mysubmodules import core
+
+# Local Repositories:{{{1
+def gitcommit(workpath, message):
+    subprocess.check_call(['git', 'add', '-A'], cwd = workpath)
+    subprocess.check_call(['git', '-c', 'user.name=clonecheck', '-c', 'user.email=clonecheck@example.com', 'commit', '--quiet', '-m', message], cwd = workpath)
+
+
+def getgithead(path):
+    return(subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = path).decode('ascii').strip())
+
+
+def makebarerepo(rootfolder, name = 'module'):
+    """
+    Make a git repository with one commit at rootfolder/name_work/ and a bare clone of it at rootfolder/name.git that I use in place of a url so no network is needed.
+
+    Return [bareurl, workpath]. Push from workpath to bareurl to change the repository (see addbarecommit).
+    """
+    workpath = os.path.join(rootfolder, name + '_work')
+    os.makedirs(workpath)
+    with open(os.path.join(workpath, 'file.txt'), 'w') as f:
+        f.write('Version 0.\n')
+    subprocess.check_call(['git', 'init', '--quiet'], cwd = workpath)
+    gitcommit(workpath, 'Version 0.')
+
+    bareurl = os.path.join(rootfolder, name + '.git')
+    subprocess.check_call(['git', 'clone', '--quiet', '--bare', workpath, bareurl])
+    subprocess.check_call(['git', 'remote', 'add', 'origin', bareurl], cwd = workpath)
+    return(bareurl, workpath)
+
+
+def addbarecommit(bareurl, workpath, text):
+    """
+    Commit text to file.txt in workpath and push it to bareurl.
+    """
+    with open(os.path.join(workpath, 'file.txt'), 'w') as f:
+        f.write(text)
+    gitcommit(workpath, text)
+    subprocess.check_call(['git', 'push', '--quiet', 'origin', 'HEAD'], cwd = workpath)
+
+
+# Checks:{{{1
+def checkclone(url, submodulepath, expectedhead, clonemode = None):
+    """
+    Raise an error if the clone at submodulepath is not a checkout of expectedhead with origin set to url.
+    A worktree checkout from the mirror has the mirror's origin rather than url.
+    """
+    if getgithead(submodulepath) != expectedhead:
+        raise ValueError('Clone is not at the expected commit: ' + submodulepath + '.')
+    with open(os.path.join(submodulepath, 'file.txt')) as f:
+        text = f.read()
+    if text != subprocess.check_output(['git', 'show', expectedhead + ':file.txt'], cwd = submodulepath).decode('utf-8'):
+        raise ValueError('Clone does not have the files of the expected commit: ' + submodulepath + '.')
+
+    if clonemode == 'worktree':
+        if not os.path.isfile(os.path.join(submodulepath, '.git')):
+            raise ValueError('Worktree checkout should have a .git file: ' + submodulepath + '.')
+    else:
+        origin = subprocess.check_output(['git', 'remote', 'get-url', 'origin'], cwd = submodulepath).decode('utf-8').strip()
+        if origin != url:
+            raise ValueError('Clone has the wrong origin: ' + submodulepath + '. Origin: ' + origin + '.')
+
+
+def checkclonemodes(rootfolder):
+    """
+    Clone a local bare repository without a mirror, with a shallow clone and with each clonemode using a mirror and check each clone.
+    """
+    bareurl, workpath = makebarerepo(rootfolder)
+    mirrorcachedir = os.path.join(rootfolder, 'mirrors')
+    head = getgithead(workpath)
+
+    core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'clone_nomirror'))
+    checkclone(bareurl, os.path.join(rootfolder, 'clone_nomirror'), head)
+
+    core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'clone_depth'), clonedepth = 1)
+    checkclone('file://' + os.path.abspath(bareurl), os.path.join(rootfolder, 'clone_depth'), head)
+
+    mirrordict = {}
+    for clonemode in ['reference', 'shared', 'worktree']:
+        submodulepath = os.path.join(rootfolder, 'clone_' + clonemode)
+        core.gitclonesubmodule(bareurl, submodulepath, mirrorcachedir = mirrorcachedir, clonemode = clonemode, mirrordict = mirrordict)
+        checkclone(bareurl, submodulepath, head, clonemode = clonemode)
+
+    if os.listdir(mirrorcachedir) != [os.path.basename(core.getmirrorpath(mirrorcachedir, bareurl))]:
+        raise ValueError('There should be one mirror: ' + str(os.listdir(mirrorcachedir)) + '.')
+
+    # worktree checkouts that have been deleted should not stop the same path being added again
+    core.rmrecursive(os.path.join(rootfolder, 'clone_worktree'))
+    core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'clone_worktree'), mirrorcachedir = mirrorcachedir, clonemode = 'worktree', mirrordict = mirrordict)
+    checkclone(bareurl, os.path.join(rootfolder, 'clone_worktree'), head, clonemode = 'worktree')
+
+
+def checkmirrorrefresh(rootfolder):
+    """
+    Push a new commit to a bare repository after its mirror is made.
+    shared and worktree clones should stay at the old commit until mirrorrefresh is True while reference clones fetch the new commit from the url.
+    """
+    bareurl, workpath = makebarerepo(rootfolder)
+    mirrorcachedir = os.path.join(rootfolder, 'mirrors')
+    oldhead = getgithead(workpath)
+    core.getmirror(mirrorcachedir, bareurl)
+
+    addbarecommit(bareurl, workpath, 'Version 1.\n')
+    newhead = getgithead(workpath)
+
+    for clonemode in ['shared', 'worktree']:
+        core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'old_' + clonemode), mirrorcachedir = mirrorcachedir, clonemode = clonemode)
+        checkclone(bareurl, os.path.join(rootfolder, 'old_' + clonemode), oldhead, clonemode = clonemode)
+
+    core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'old_reference'), mirrorcachedir = mirrorcachedir, clonemode = 'reference')
+    checkclone(bareurl, os.path.join(rootfolder, 'old_reference'), newhead)
+
+    for clonemode in ['shared', 'worktree']:
+        core.gitclonesubmodule(bareurl, os.path.join(rootfolder, 'new_' + clonemode), mirrorcachedir = mirrorcachedir, mirrorrefresh = True, clonemode = clonemode)
+        checkclone(bareurl, os.path.join(rootfolder, 'new_' + clonemode), newhead, clonemode = clonemode)
+
+
+def checkmirrorrace(rootfolder, processes = 4):
+    """
+    Create the same mirror from several processes at the same time.
+    Every process should get the same complete mirror and no temporary folders should be left.
+    """
+    bareurl, workpath = makebarerepo(rootfolder)
+    mirrorcachedir = os.path.join(rootfolder, 'mirrors')
+    projectdir = os.path.dirname(os.path.abspath(__file__))
+
+    command = [sys.executable, '-c', 'import sys; from mysubmodules import core; print(core.getmirror(sys.argv[1], sys.argv[2]))', mirrorcachedir, bareurl]
+    popens = [subprocess.Popen(command, cwd = projectdir, stdout = subprocess.PIPE) for i in range(processes)]
+    mirrorpaths = set()
+    for popen in popens:
+        output = popen.communicate()[0]
+        if popen.returncode != 0:
+            raise ValueError('getmirror failed in one of the processes.')
+        mirrorpaths.add(output.decode('utf-8').strip())
+
+    if mirrorpaths != {core.getmirrorpath(mirrorcachedir, bareurl)}:
+        raise ValueError('Processes got different mirrors: ' + str(sorted(mirrorpaths)) + '.')
+    if os.listdir(mirrorcachedir) != [os.path.basename(core.getmirrorpath(mirrorcachedir, bareurl))]:
+        raise ValueError('Temporary mirrors were left: ' + str(os.listdir(mirrorcachedir)) + '.')
+    if subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = mirrorpaths.pop()).decode('ascii').strip() != getgithead(workpath):
+        raise ValueError('Mirror is not complete.')
+
+
+def runclonechecks():
+    """
+    Run each check in its own temporary folder. Raise an error if any fail.
+    """
+    for check in [checkclonemodes, checkmirrorrefresh, checkmirrorrace]:
+        rootfolder = tempfile.mkdtemp()
+        try:
+            check(rootfolder)
+        finally:
+            core.rmrecursive(rootfolder)
+        print(check.__name__ + ': passed.')
+
+
+# Run:{{{1
+if __name__ == '__main__':
+    runclonechecks()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+"""
+The functions are in mysubmodules.core and the command line is in mysubmodules.cli.
+
+I only import mysubmodules.core when one of its functions is used (i.e. mysubmodules.dosubmodules_local) so python -m mysubmodules --help does not need to load it.
+"""
+
+def __getattr__(name):
+    import importlib
+
+    # from mysubmodules import cli asks for the attribute before importing the submodule so I should not load core then
+    if name in ['cli', 'core']:
+        return(importlib.import_module(__name__ + '.' + name))
+
+    core = importlib.import_module(__name__ + '.core')
+    try:
+        return(getattr(core, name))
+    except AttributeError:
+        raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name)) from None
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+from mysubmodules import cli
+
+cli.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+import os
+import sys
+
+# Command Line:{{{1
+def getparser():
+    """
+    Get the argparse parser for main.
+    This only needs argparse so --help does not need to import mysubmodules.core.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog = 'mysubmodules', description = 'Add the submodules for every git project in a folder.')
+    parser.add_argument('rootfolder', nargs = '?', default = os.getcwd(), help = 'Folder containing the projects. Default: the current directory.')
+    parser.add_argument('--workers', type = int, help = 'Number of submodules to copy at the same time.')
+    parser.add_argument('--scanworkers', type = int, help = 'Number of files to parse at the same time.')
+    parser.add_argument('--scancachefile', help = 'File to save the results of parsing files in.')
+    parser.add_argument('--storepath', help = 'Copy submodules through a content-addressed store here.')
+    parser.add_argument('--syncbackend', choices = ['rsync', 'native'], help = 'Default: mysubmodules.core.syncbackend_default.')
+    parser.add_argument('--trashdir', help = 'Move folders here and delete them in the background.')
+    parser.add_argument('--mirrorcachedir', help = 'Keep bare mirrors of cloned repositories here.')
+    parser.add_argument('--mirrorrefresh', action = 'store_true', help = 'Fetch changes to the mirrors in mirrorcachedir.')
+    parser.add_argument('--gitclonelocal', action = 'store_true', help = 'Use git clone rather than copying the projects.')
+    parser.add_argument('--readonly', action = 'store_true')
+    parser.add_argument('--usestamps', action = 'store_true', help = 'Skip submodules whose source has not changed.')
+    parser.add_argument('--uselockfile', action = 'store_true', help = 'Skip projects where nothing has changed.')
+    parser.add_argument('--usemanifest', action = 'store_true', help = 'Use .mysubmodules files where they exist.')
+    parser.add_argument('--staged', action = 'store_true', help = 'Build the submodules folders in a staging folder and swap them in at the end.')
+    parser.add_argument('--noclone', action = 'store_true', help = 'Do not git clone submodules that are not in the folder.')
+    parser.add_argument('--urlpathstart', help = 'git clone submodules that are not in the folder from urlpathstart + submodule + urlpathend.')
+    parser.add_argument('--urlpathend', help = 'See --urlpathstart.')
+    parser.add_argument('--printdetails', action = 'store_true')
+    parser.add_argument('--tracefile', help = 'Save a trace of the time spent in each phase, submodule and subprocess to this file.')
+    parser.add_argument('--traceformat', default = 'chrome', choices = ['chrome', 'json'], help = 'chrome gives a file that can be opened in chrome://tracing or ui.perfetto.dev.')
+    parser.add_argument('--status', action = 'store_true', help = 'Only report submodules that are missing, stale, extra or modified and exit with an error if there are any. Nothing is changed.')
+    return(parser)
+
+
+def main(argv = None, urlpathstart = None, urlpathend = ''):
+    """
+    Run mysubmodules.core.allmodulesinfolder from the command line.
+
+    urlpathstart and urlpathend are the defaults for --urlpathstart and --urlpathend (i.e. allgitmodules.py sets them to clone from my github).
+    I only import mysubmodules.core after the arguments are parsed so --help and argument errors are quick.
+    """
+    args = getparser().parse_args(argv)
+
+    if args.urlpathstart is not None:
+        urlpathstart = args.urlpathstart
+    if args.urlpathend is not None:
+        urlpathend = args.urlpathend
+    if args.noclone is True:
+        urlpathstart = None
+
+    from mysubmodules import core
+
+    kwargs = {}
+    if args.syncbackend is not None:
+        kwargs['syncbackend'] = args.syncbackend
+
+    if args.tracefile is not None:
+        core.starttrace()
+
+    # write the trace even if the run fails or exits with an error
+    try:
+        if args.status is True:
+            problems = core.statusmodulesinfolder(args.rootfolder, scancachefile = args.scancachefile, usemanifest = args.usemanifest)
+            core.printsubmodulesstatus(problems)
+            if len(core.getsubmodulesproblems(problems)) > 0:
+                sys.exit(1)
+            return(None)
+
+        failures = core.allmodulesinfolder(args.rootfolder, urlpathstart = urlpathstart, urlpathend = urlpathend, printdetails = args.printdetails, workers = args.workers, scanworkers = args.scanworkers, scancachefile = args.scancachefile, storepath = args.storepath, trashdir = args.trashdir, mirrorcachedir = args.mirrorcachedir, mirrorrefresh = args.mirrorrefresh, gitclonelocal = args.gitclonelocal, readonly = args.readonly, usestamps = args.usestamps, uselockfile = args.uselockfile, usemanifest = args.usemanifest, staged = args.staged, **kwargs)
+    finally:
+        if args.tracefile is not None:
+            core.stoptrace(tracefile = args.tracefile, traceformat = args.traceformat)
+
+    if len(failures) > 0:
+        print(str(len(failures)) + ' submodules failed.')
+        sys.exit(1)
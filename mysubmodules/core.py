@@ -0,0 +1,3586 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+import contextlib
+import datetime
+import functools
+import os
+import threading
+
+# Get Files:{{{1
+# Basic Definitions:{{{1
+submodulecharacters_default = 'a-z0-9_-'
+parsefilestype = 'gitls'
+filestoparse = None
+# default way to find the files in a module that contain submodules
+# 'python' reads every file given by git ls-files in Python
+# 'gitgrep' uses git grep to find the files that could contain submodules and then only reads these in Python
+scanbackend_default = 'python'
+# maximum number of files kept in the scan cache before the least recently used are dropped
+scancachemaxentries_default = 200000
+# file in a module listing its submodules (see readmanifest)
+manifestfilename_default = '.mysubmodules'
+# file in each copied submodule recording the version of the source it was copied from
+stampfilename_default = '.mysubmodules_stamp'
+# file in each project recording the submodules added to it and the versions of their sources (see getlockfile)
+lockfilename_default = '.mysubmodules.lock'
+# version of the lockfile format - lockfiles with a different version are ignored
+lockfileversion = 1
+# folder in each project where its submodules folders are built before being swapped in (see preparestaging)
+stagingfoldername_default = '.mysubmodules_staging'
+# version of the scan cache format - caches saved with a different version are ignored
+scancacheversion = 2
+# files are parsed in chunks of this many bytes so memory use does not depend on the size of the largest file
+scanchunksize_default = 1024 * 1024
+# number of characters kept between chunks - a submodule reference longer than this that crosses a chunk boundary can be missed
+scanoverlap_default = 4096
+# deletes folders moved to the trash in the background (see rmrecursive)
+trashexecutor = None
+# [trashpath, future] for each folder being deleted in the background so errors can be reported (see waitfortrash)
+trashfutures = []
+trashlock = threading.Lock()
+# so only one thread creates or fetches each mirror at a time (see getmirror)
+mirrorlocks = {}
+mirrorlock = threading.Lock()
+# default way to copy submodules folder to folder
+# 'rsync' runs rsync for each submodule
+# 'native' copies in Python (see syncsubmodule) which avoids starting a process for each submodule and works where rsync isn't installed
+syncbackend_default = 'rsync'
+# records phases, subprocesses and counts of files and bytes while a trace is running (see starttrace)
+tracer = None
+tracelock = threading.Lock()
+# the phases currently running in each thread
+tracelocal = threading.local()
+
+# Tracing:{{{1
+def starttrace(callback = None):
+    """
+    Start recording a trace of what I do.
+
+    A trace is made up of events for:
+    - phases of a run (i.e. building the dependency graph, adding the submodules, checking lockfiles)
+    - each task in runsubmoduletasks (i.e. adding each submodule) with the module name and path
+    - each time a module is parsed for submodules
+    - each rsync/git subprocess (see runsubprocess)
+    - each folder deleted
+    While an event is running in a thread, counts of files scanned, bytes read, bytes copied and bytes deleted in that thread are added to it (see tracecount).
+    So the event for adding a submodule gives how much was copied and deleted for that submodule.
+    Counts in worker processes (scanworkertype = 'process') are not recorded.
+
+    callback(event) is optionally called with each event when it finishes so the trace can be sent somewhere else as well.
+    Return the trace which is also saved in tracer.
+    """
+    global tracer
+    import time
+
+    tracer = {'starttime': time.perf_counter(), 'events': [], 'counts': {}, 'callback': callback}
+    return(tracer)
+
+
+def stoptrace(tracefile = None, traceformat = 'chrome'):
+    """
+    Stop recording the trace and return it. If tracefile is given, save it there (see writetrace).
+    """
+    global tracer
+
+    thistracer = tracer
+    tracer = None
+    if thistracer is not None and tracefile is not None:
+        writetrace(thistracer, tracefile, traceformat = traceformat)
+    return(thistracer)
+
+
+def tracebegin(name, category, **args):
+    """
+    Start an event in the trace. args are saved with the event.
+    Return the event (to give to traceend) or None if I'm not tracing.
+    """
+    import time
+
+    if tracer is None:
+        return(None)
+    event = {'name': name, 'cat': category, 'start': time.perf_counter(), 'tid': threading.get_ident(), 'args': args}
+    if not hasattr(tracelocal, 'events'):
+        tracelocal.events = []
+    tracelocal.events.append(event)
+    return(event)
+
+
+def traceend(event, **args):
+    """
+    Finish event from tracebegin. args are added to the event.
+    """
+    import time
+
+    if event is None:
+        return(None)
+    event['seconds'] = time.perf_counter() - event['start']
+    event['args'].update(args)
+    if event in tracelocal.events:
+        tracelocal.events.remove(event)
+
+    thistracer = tracer
+    if thistracer is None:
+        return(None)
+    event['start'] = event['start'] - thistracer['starttime']
+    with tracelock:
+        thistracer['events'].append(event)
+    if thistracer['callback'] is not None:
+        thistracer['callback'](event)
+
+
+@contextlib.contextmanager
+def tracephase(name, category, **args):
+    """
+    tracebegin and traceend around a with block.
+    """
+    event = tracebegin(name, category, **args)
+    try:
+        yield(event)
+    finally:
+        traceend(event)
+
+
+def tracecount(countname, value):
+    """
+    Add value to the count countname for the whole trace and for every event running in this thread.
+    """
+    thistracer = tracer
+    if thistracer is None:
+        return(None)
+    with tracelock:
+        thistracer['counts'][countname] = thistracer['counts'].get(countname, 0) + value
+    for event in getattr(tracelocal, 'events', []):
+        event['args'][countname] = event['args'].get(countname, 0) + value
+
+
+def runsubprocess(funcname, command, **kwargs):
+    """
+    Run subprocess.funcname(command, **kwargs) where funcname is i.e. 'check_call' and record it in the trace if I'm tracing.
+    I import subprocess here rather than at the top so importing this module stays quick.
+    """
+    import subprocess
+
+    func = getattr(subprocess, funcname)
+    if tracer is None:
+        return(func(command, **kwargs))
+
+    # name the event after the program and the git subcommand
+    name = os.path.basename(command[0])
+    if name == 'git':
+        i = 1
+        while i < len(command) and command[i].startswith('-'):
+            # -C takes an argument
+            if command[i] == '-C':
+                i = i + 1
+            i = i + 1
+        if i < len(command):
+            name = name + ' ' + command[i]
+    with tracephase(name, 'subprocess', command = ' '.join(command), cwd = kwargs.get('cwd')):
+        return(func(command, **kwargs))
+
+
+def writetrace(thistracer, tracefile, traceformat = 'chrome'):
+    """
+    Save a trace from starttrace to tracefile.
+
+    traceformat:
+    - 'chrome': the Chrome trace event format which can be opened in chrome://tracing or https://ui.perfetto.dev
+    - 'json': the counts for the whole trace, the total time and number of events for each event name and a list of the events
+    """
+    import json
+
+    if traceformat == 'chrome':
+        traceevents = []
+        for event in thistracer['events']:
+            traceevents.append({'name': event['name'], 'cat': event['cat'], 'ph': 'X', 'ts': event['start'] * 1e6, 'dur': event['seconds'] * 1e6, 'pid': os.getpid(), 'tid': event['tid'], 'args': event['args']})
+        output = {'traceEvents': traceevents, 'displayTimeUnit': 'ms', 'otherData': {'counts': thistracer['counts']}}
+    elif traceformat == 'json':
+        totals = {}
+        for event in thistracer['events']:
+            if event['name'] not in totals:
+                totals[event['name']] = {'category': event['cat'], 'number': 0, 'seconds': 0}
+            totals[event['name']]['number'] = totals[event['name']]['number'] + 1
+            totals[event['name']]['seconds'] = totals[event['name']]['seconds'] + event['seconds']
+        output = {'counts': thistracer['counts'], 'totals': totals, 'events': [{'name': event['name'], 'category': event['cat'], 'start': event['start'], 'seconds': event['seconds'], 'thread': event['tid'], 'args': event['args']} for event in thistracer['events']]}
+    else:
+        raise ValueError('traceformat not recognised: ' + str(traceformat) + '.')
+
+    with open(tracefile, 'w') as f:
+        json.dump(output, f, indent = 1, default = str)
+
+
+# Add Chmod and Recursive so don't load modules:{{{1
+def chmodrecursive(folder, mode, dirsonly = False):
+    """
+    Mode takes format 0o777
+
+    Also used in mysubmodules project.
+
+    Go through folders by file descriptor so each chmod doesn't need to look up the full path again. Symlinks are not changed or followed.
+    If dirsonly is True, only folders are changed i.e. so files hard linked from the store keep their permissions.
+    """
+    import os
+
+    if not os.path.islink(folder):
+        if os.path.isdir(folder):
+            os.chmod(folder, mode)
+            # stack of [folder file descriptor, entries left to do in folder]
+            stack = []
+            try:
+                fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+                with os.scandir(fd) as it:
+                    stack.append([fd, list(it)])
+                while len(stack) > 0:
+                    fd, entries = stack[-1]
+                    if len(entries) == 0:
+                        os.close(fd)
+                        stack.pop()
+                        continue
+                    entry = entries.pop()
+                    if entry.is_symlink():
+                        continue
+                    if dirsonly is True and not entry.is_dir(follow_symlinks = False):
+                        continue
+                    # chmod before opening a folder so I can get into it
+                    os.chmod(entry.name, mode, dir_fd = fd)
+                    if entry.is_dir(follow_symlinks = False):
+                        subfd = os.open(entry.name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd = fd)
+                        with os.scandir(subfd) as it:
+                            stack.append([subfd, list(it)])
+            finally:
+                for fd, entries in stack:
+                    os.close(fd)
+        elif dirsonly is False:
+            os.chmod(folder, mode)
+
+
+
+
+def rmtreefd(folder):
+    """
+    Delete the folder folder and everything in it in a single pass, going through folders by file descriptor.
+    Permissions are only changed where deleting fails because of them i.e. a folder I can't read or can't delete things from (like in a read only submodule).
+    """
+
+    def withpermission(func, chmodfunc):
+        # run func and if it fails because of permissions run chmodfunc and try again
+        try:
+            return(func())
+        except PermissionError:
+            chmodfunc()
+            return(func())
+
+    def opendir(name, dir_fd):
+        return(withpermission(lambda: os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd = dir_fd), lambda: os.chmod(name, 0o755, dir_fd = dir_fd)))
+
+    def listdir(fd):
+        with os.scandir(fd) as it:
+            return(list(it))
+
+    # stack of [folder file descriptor, entries left to do in folder, name of folder in the folder above]
+    stack = []
+    try:
+        fd = opendir(folder, None)
+        stack.append([fd, listdir(fd), None])
+        while len(stack) > 0:
+            fd, entries, name = stack[-1]
+            if len(entries) == 0:
+                os.close(fd)
+                stack.pop()
+                if len(stack) > 0:
+                    parentfd = stack[-1][0]
+                    withpermission(functools.partial(os.rmdir, name, dir_fd = parentfd), functools.partial(os.chmod, parentfd, 0o755))
+                continue
+            entry = entries.pop()
+            if entry.is_dir(follow_symlinks = False):
+                subfd = opendir(entry.name, fd)
+                stack.append([subfd, listdir(subfd), entry.name])
+            else:
+                if tracer is not None:
+                    tracecount('filesdeleted', 1)
+                    tracecount('bytesdeleted', entry.stat(follow_symlinks = False).st_size)
+                withpermission(functools.partial(os.unlink, entry.name, dir_fd = fd), functools.partial(os.chmod, fd, 0o755))
+    finally:
+        for fd, entries, name in stack:
+            os.close(fd)
+
+    os.rmdir(folder)
+
+
+def rmrecursive(folder, trashdir = None):
+    """
+    Delete folder (or file) whatever its permissions.
+
+    If trashdir is given, folders are renamed into trashdir and then deleted in the background so I don't need to wait for large folders to be deleted (see movetotrash).
+    """
+    import shutil
+
+    if folder.endswith('/') or folder.endswith('\\'):
+        folder = folder[: -1]
+
+    if not os.path.islink(folder) and os.path.isdir(folder):
+        if trashdir is not None:
+            trashpath = movetotrash(folder, trashdir)
+            if trashpath is not None:
+                with trashlock:
+                    global trashexecutor
+                    if trashexecutor is None:
+                        import concurrent.futures
+                        trashexecutor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+                    trashfutures.append([trashpath, trashexecutor.submit(rmrecursive, trashpath)])
+                return(None)
+
+        try:
+            with tracephase('rmrecursive', 'delete', folder = folder):
+                rmtreefd(folder)
+        except OSError:
+            # fall back to making every folder writable and then deleting
+            # only folders so files hard linked from the store stay read only for their other links
+            if not os.path.lexists(folder):
+                raise
+            chmodrecursive(folder, 0o755, dirsonly = True)
+            shutil.rmtree(folder)
+    else:
+        if tracer is not None:
+            tracecount('filesdeleted', 1)
+            tracecount('bytesdeleted', os.lstat(folder).st_size)
+        os.remove(folder)
+
+
+def movetotrash(folder, trashdir):
+    """
+    Rename folder into trashdir so it can be deleted later.
+    trashdir needs to be on the same filesystem as folder. If it isn't, return None and don't move folder. Otherwise return the new path of folder.
+    """
+    import errno
+    import uuid
+
+    os.makedirs(trashdir, exist_ok = True)
+    trashpath = os.path.join(trashdir, os.path.basename(folder) + '_' + uuid.uuid4().hex)
+
+    # need to be able to write in a folder to move it to a different folder
+    if not os.access(folder, os.W_OK):
+        os.chmod(folder, 0o755)
+    try:
+        os.rename(folder, trashpath)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            return(None)
+        raise
+    return(trashpath)
+
+
+def waitfortrash():
+    """
+    Wait for the folders being deleted in the background by rmrecursive.
+    Return a list of [description, error] for any that failed to be deleted.
+    """
+    global trashexecutor
+
+    with trashlock:
+        executor = trashexecutor
+        trashexecutor = None
+        futures = list(trashfutures)
+        trashfutures.clear()
+    if executor is not None:
+        executor.shutdown(wait = True)
+
+    failures = []
+    for trashpath, future in futures:
+        if future.exception() is not None:
+            failures.append(['Deleting in the background failed: ' + trashpath + '.', str(future.exception())])
+    return(failures)
+
+
+def emptytrash(trashdir, wait = True):
+    """
+    Delete everything in trashdir i.e. folders left from a run that stopped before it finished deleting them.
+    If wait is True, first wait for folders being deleted in the background by rmrecursive (see waitfortrash). Any that failed are deleted again here.
+    """
+    if wait is True:
+        waitfortrash()
+    if os.path.isdir(trashdir):
+        for name in os.listdir(trashdir):
+            rmrecursive(os.path.join(trashdir, name))
+
+
+# Scan Cache:{{{1
+def loadscancache(cachefile, submodulecharacters = submodulecharacters_default):
+    """
+    Load the cache of per-file getsubmodulesmulti results saved by savescancache.
+    If the file does not exist, cannot be read or was made with different submodulecharacters then return an empty cache.
+
+    scancache['entries'][key] = [lastused, {submoduleid: [submodules in the order they appear]}, isbinary]
+    The dict is None if the file was skipped because it was binary.
+    key is 'blob:BLOBSHA' for unmodified files tracked by git or 'stat:FILENAME:INODE:SIZE:MTIME' otherwise.
+    """
+    import json
+
+    scancache = None
+    if cachefile is not None and os.path.isfile(cachefile):
+        try:
+            with open(cachefile) as f:
+                scancache = json.load(f)
+        except Exception:
+            print('Scan cache could not be read so ignored: ' + cachefile + '.')
+            scancache = None
+
+    if scancache is None or scancache.get('version') != scancacheversion or scancache.get('submodulecharacters') != submodulecharacters:
+        scancache = {'version': scancacheversion, 'submodulecharacters': submodulecharacters, 'counter': 0, 'entries': {}}
+
+    # count runs so I know which entries were used least recently
+    scancache['counter'] = scancache['counter'] + 1
+
+    return(scancache)
+
+
+def savescancache(scancache, cachefile, maxentries = scancachemaxentries_default):
+    """
+    Save the scan cache to cachefile.
+    Only keep the maxentries most recently used entries.
+    Write to a temporary file and then rename so an interrupted save does not leave a broken cache.
+    """
+    import json
+
+    entries = scancache['entries']
+    if maxentries is not None and len(entries) > maxentries:
+        keys = sorted(entries, key = lambda key: entries[key][0], reverse = True)
+        for key in keys[maxentries: ]:
+            del entries[key]
+
+    cachefolder = os.path.dirname(os.path.abspath(cachefile))
+    if not os.path.isdir(cachefolder):
+        os.makedirs(cachefolder)
+    with open(cachefile + '.tmp', 'w') as f:
+        json.dump(scancache, f)
+    os.replace(cachefile + '.tmp', cachefile)
+
+
+def getscancachekeys(modulepath, files):
+    """
+    Get the scan cache key for each filename in files.
+    Use the git blob hash from git ls-files -s where the file is tracked and unmodified since this is shared between every copy of the file.
+    Otherwise use the inode, size and modification time of the file.
+    Files that don't exist are not included.
+    """
+    blobdict = {}
+    if modulepath is not None:
+        modifiedfiles = set(os.fsdecode(f) for f in runsubprocess('check_output', ['git', 'ls-files', '-m', '-z'], cwd = modulepath).split(b'\0') if len(f) > 0)
+        for line in runsubprocess('check_output', ['git', 'ls-files', '-s', '-z'], cwd = modulepath).split(b'\0'):
+            if len(line) == 0:
+                continue
+            details, filename = line.split(b'\t', 1)
+            filename = os.fsdecode(filename)
+            if filename not in modifiedfiles:
+                blobdict[modulepath + filename] = details.split(b' ')[1].decode('ascii')
+
+    keysdict = {}
+    for filename in files:
+        if filename in blobdict:
+            # still need to check the file exists in the working tree (e.g. I may have deleted it)
+            if os.path.isfile(filename):
+                keysdict[filename] = 'blob:' + blobdict[filename]
+        else:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            keysdict[filename] = 'stat:' + filename + ':' + str(st.st_ino) + ':' + str(st.st_size) + ':' + str(st.st_mtime_ns)
+
+    return(keysdict)
+
+
+# Getting Submodules Functions:{{{1
+def getgitgrepfiles(modulepath, submoduleids):
+    """
+    Use git grep to get the tracked files in modulepath that contain 'SUBMODULEID/' for any SUBMODULEID in submoduleids.
+    Every file that contains a match for the submodule regex in getsubmodulesmulti must contain this string so only these files need to be parsed.
+    git grep searches the files natively and in parallel which is much quicker than reading every file in Python when few files contain submodules.
+
+    --text ensures binary files are searched as well since they are parsed by the python backend.
+    """
+    import subprocess
+
+    grepcommand = ['git', 'grep', '-l', '-z', '--text', '--fixed-strings']
+    for submoduleid in submoduleids:
+        grepcommand = grepcommand + ['-e', submoduleid + '/']
+
+    process = runsubprocess('run', grepcommand, cwd = modulepath, stdout = subprocess.PIPE)
+    # git grep returns 1 if there are no matches
+    if process.returncode == 1:
+        return([])
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, grepcommand)
+
+    files = [modulepath + os.fsdecode(f) for f in process.stdout.split(b'\0') if len(f) > 0]
+
+    return(files)
+
+
+def scanfileforsubmodules(filename, resubmodules, skipbinary = False, chunksize = scanchunksize_default, overlap = scanoverlap_default):
+    """
+    Read a file once and return [isbinary, matchesdict] where matchesdict gives the submodules (in the order they appear) for each [submoduleid, compiled regex] in resubmodules.
+
+    The file is read in chunks of chunksize bytes (decoded as latin-1) so memory use stays flat however large the file is.
+    The last overlap characters of each chunk are kept and searched again with the next chunk so matches that cross a chunk boundary are still found.
+    Each regex only accepts matches that start before the overlap and restarts from the end of its last match so no match is found twice.
+
+    isbinary is True if there is a null byte in the first 8000 bytes (the same check as git).
+    If skipbinary is True and the file is binary then return [True, None] without reading the rest of the file.
+    """
+    matchesdict = {}
+    # position in text to continue searching from for each regex
+    startposdict = {}
+    for submoduleid, resubmodule in resubmodules:
+        matchesdict[submoduleid] = []
+        startposdict[submoduleid] = 0
+
+    isbinary = None
+    text = ''
+    tracecount('filesscanned', 1)
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunksize)
+            tracecount('bytesread', len(chunk))
+            if isbinary is None:
+                isbinary = b'\0' in chunk[: 8000]
+                if isbinary is True and skipbinary is True:
+                    return([True, None])
+            finalchunk = len(chunk) == 0
+
+            text = text + chunk.decode('latin-1')
+            if finalchunk is True:
+                limit = len(text)
+            else:
+                limit = len(text) - overlap
+
+            keepfrom = len(text)
+            for submoduleid, resubmodule in resubmodules:
+                startpos = startposdict[submoduleid]
+                for match in resubmodule.finditer(text, startpos):
+                    # this match might continue into the next chunk so look for it again with the next chunk
+                    if match.start() >= limit:
+                        break
+                    matchesdict[submoduleid].append(match.group(1))
+                    startpos = match.end()
+                startpos = max(startpos, limit)
+                startposdict[submoduleid] = startpos
+                # keep an extra character before startpos for the lookbehind in the regex
+                keepfrom = min(keepfrom, startpos - 1)
+
+            if finalchunk is True:
+                break
+
+            keepfrom = max(keepfrom, 0)
+            text = text[keepfrom: ]
+            for submoduleid in startposdict:
+                startposdict[submoduleid] = startposdict[submoduleid] - keepfrom
+
+    return([isbinary, matchesdict])
+
+
+def scanfilesforsubmodules(files, resubmodules, workers = None, workertype = 'thread', skipbinary = False):
+    """
+    Run scanfileforsubmodules on every file in files and return a list of the results in the same order as files.
+
+    If workers is None or 1 then go through the files one at a time.
+    Otherwise spread the files across a pool of workers. workertype is 'thread' or 'process'.
+    Threads are cheaper to start and are fine when reading the files is the bottleneck. Processes also spread out the regex matching.
+    """
+    import concurrent.futures
+
+    scanfunc = functools.partial(scanfileforsubmodules, resubmodules = resubmodules, skipbinary = skipbinary)
+
+    if workers is None or workers <= 1 or len(files) <= 1:
+        return(list(map(scanfunc, files)))
+
+    if workertype == 'thread':
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+            matcheslist = list(executor.map(scanfunc, files))
+    elif workertype == 'process':
+        # send files in chunks to limit the cost of passing results between processes
+        chunksize = max(1, min(256, len(files) // (workers * 4)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            matcheslist = list(executor.map(scanfunc, files, chunksize = chunksize))
+    else:
+        raise ValueError('workertype should be thread or process: ' + str(workertype) + '.')
+
+    return(matcheslist)
+
+
+def getsubmodulesmulti(modulepath, submoduleids = ['submodules', 'submodules2'], submodulecharacters = submodulecharacters_default, filestoparse = None, submoduleslistcheck = None, scancache = None, workers = None, workertype = 'thread', scanbackend = scanbackend_default, skipbinary = False, maxfilesize = None, includeglobs = None, excludeglobs = None, extrafiles = None):
+    """
+    Parse the files in a module for terms satisfying something like 'SUBMODULEID/SUBMODULENAME/' for every SUBMODULEID in submoduleids.
+    Output a dict where submodulesdict[SUBMODULEID] is a unique sorted list of the SUBMODULENAME terms.
+
+    git ls-files is only run once and each file is only opened and read once however many submoduleids are given.
+
+    scancache is a cache loaded by loadscancache. If given, files are only read if they are not already in the cache and the cache is updated with the new files. Save it with savescancache.
+
+    workers and workertype allow files to be read and parsed by a pool of workers (see scanfilesforsubmodules). The output and warnings are the same as when parsing one file at a time.
+
+    scanbackend is 'python' or 'gitgrep'. With 'gitgrep', git grep first finds the files that could contain submodules (see getgitgrepfiles) and only these are parsed. The output is the same as with 'python'. If filestoparse is given then 'python' is always used.
+
+    extrafiles are files to parse as well as the ones git lists (i.e. new files that haven't been added to git yet). They are ignored if filestoparse is given.
+
+    Files are read in chunks (see scanfileforsubmodules) so large files do not need to be held in memory. To skip files altogether:
+    - skipbinary: skip files that look binary
+    - maxfilesize: skip files larger than this many bytes
+    - includeglobs: only parse files whose path relative to modulepath matches one of these globs (matched with fnmatch so * matches / as well)
+    - excludeglobs: don't parse files whose path relative to modulepath matches one of these globs
+
+    Other arguments are the same as in getsubmodules.
+    """
+    import fnmatch
+    import os
+    import re
+
+    if modulepath[-1] != '/':
+        modulepath = modulepath + '/'
+
+    # one regex per submoduleid rather than one combined regex so matches for different ids can overlap in the same way as when each id is parsed separately
+    resubmodules = [[submoduleid, re.compile('(?<![a-z0-9_-])' + re.escape(submoduleid + '/') + '([' + submodulecharacters + ']*?)' + re.escape('/'))] for submoduleid in submoduleids]
+
+    if filestoparse is None:
+        if scanbackend == 'python':
+            # do git ls
+            # -z stops git quoting paths with unusual characters (i.e. non-ascii) which would then not be found
+            files = [modulepath + os.fsdecode(f) for f in runsubprocess('check_output', ['git', 'ls-files', '-z'], cwd = modulepath).split(b'\0') if len(f) > 0]
+        elif scanbackend == 'gitgrep':
+            files = getgitgrepfiles(modulepath, submoduleids)
+        else:
+            raise ValueError('scanbackend should be python or gitgrep: ' + str(scanbackend) + '.')
+        if extrafiles is not None:
+            gitfiles = set(files)
+            files = files + [filename for filename in extrafiles if filename not in gitfiles]
+    else:
+        files = filestoparse
+
+    if scancache is not None:
+        if scancache['submodulecharacters'] != submodulecharacters:
+            raise ValueError('scancache was loaded with different submodulecharacters: ' + scancache['submodulecharacters'] + '.')
+        if filestoparse is None:
+            keysdict = getscancachekeys(modulepath, files)
+        else:
+            keysdict = getscancachekeys(None, files)
+
+    # work out which files actually need to be read
+    matchesdictall = {}
+    filestoscan = []
+    for filename in files:
+        if filename in matchesdictall:
+            continue
+
+        if includeglobs is not None or excludeglobs is not None:
+            if filename.startswith(modulepath):
+                relfilename = filename[len(modulepath): ]
+            else:
+                relfilename = filename
+            if includeglobs is not None and not any(fnmatch.fnmatchcase(relfilename, glob) for glob in includeglobs):
+                continue
+            if excludeglobs is not None and any(fnmatch.fnmatchcase(relfilename, glob) for glob in excludeglobs):
+                continue
+        if maxfilesize is not None:
+            try:
+                if os.path.getsize(filename) > maxfilesize:
+                    continue
+            except OSError:
+                continue
+
+        if scancache is not None:
+            if filename not in keysdict:
+                continue
+            entry = scancache['entries'].get(keysdict[filename])
+            if entry is not None and skipbinary is True and entry[2] is True:
+                # known binary file
+                entry[0] = scancache['counter']
+                continue
+            if entry is not None and entry[1] is not None and all(submoduleid in entry[1] for submoduleid in submoduleids):
+                matchesdictall[filename] = entry[1]
+                entry[0] = scancache['counter']
+                continue
+        else:
+            if not os.path.isfile(filename):
+                continue
+        filestoscan.append(filename)
+        # placeholder to keep track of files already added to filestoscan
+        matchesdictall[filename] = None
+
+    # read the files
+    matcheslist = scanfilesforsubmodules(filestoscan, resubmodules, workers = workers, workertype = workertype, skipbinary = skipbinary)
+    for filename, (isbinary, matchesdict) in zip(filestoscan, matcheslist):
+        if scancache is not None:
+            key = keysdict[filename]
+            entry = scancache['entries'].get(key)
+            if entry is not None and entry[1] is not None and matchesdict is not None:
+                matchesdict = dict(entry[1], **matchesdict)
+            scancache['entries'][key] = [scancache['counter'], matchesdict, isbinary]
+        # matchesdict is None if skipped as binary
+        matchesdictall[filename] = matchesdict
+
+    # go through the files in their original order so warnings are given in the same order
+    submodulesdict = {}
+    for submoduleid in submoduleids:
+        submodulesdict[submoduleid] = set()
+
+    for filename in files:
+        if matchesdictall.get(filename) is None:
+            continue
+        matchesdict = matchesdictall[filename]
+
+        for submoduleid in submoduleids:
+            for submodule in matchesdict[submoduleid]:
+                if submoduleslistcheck is None or submodule in submoduleslistcheck:
+                    submodulesdict[submoduleid].add(submodule)
+                else:
+                    print('WARNING: submodule is not in modulelistcheck so is ignored: Filename: ' + filename + '. Submodule: ' + submodule + '.')
+
+    for submoduleid in submoduleids:
+        submodulesdict[submoduleid] = sorted(list(submodulesdict[submoduleid]))
+
+    return(submodulesdict)
+
+
+def getsubmodules(modulepath, submoduleid = 'submodules', submodulecharacters = submodulecharacters_default, filestoparse = None, submoduleslistcheck = None, workers = None, workertype = 'thread', scanbackend = scanbackend_default, skipbinary = False, maxfilesize = None, includeglobs = None, excludeglobs = None):
+    """
+    Parse the files in a module for terms satisfying something like 'submodules/SUBMODULENAME/'.
+    Output a unique list of the SUBMODULENAME terms.
+
+    If filestoparse is None, parse by gitls. If, instead, filestoparse is list of files then go through these.
+    Or can give list of files to go through (better when making changes since otherwise have to do git add when introduce new files).
+
+    submoduleslistcheck is a list of possible modules. If outside of this list then print a message and don't include the submodule.
+
+    workers is the number of workers to parse the files with (see scanfilesforsubmodules). By default, parse one file at a time.
+    scanbackend is 'python' or 'gitgrep' (see getsubmodulesmulti).
+    skipbinary, maxfilesize, includeglobs and excludeglobs allow files to be skipped (see getsubmodulesmulti).
+
+    If I need to parse for more than one submoduleid, use getsubmodulesmulti so files are only read once.
+    """
+    submodulesdict = getsubmodulesmulti(modulepath, submoduleids = [submoduleid], submodulecharacters = submodulecharacters, filestoparse = filestoparse, submoduleslistcheck = submoduleslistcheck, workers = workers, workertype = workertype, scanbackend = scanbackend, skipbinary = skipbinary, maxfilesize = maxfilesize, includeglobs = includeglobs, excludeglobs = excludeglobs)
+
+    return(submodulesdict[submoduleid])
+
+    
+def readmanifest(modulepath, manifestfilename = manifestfilename_default):
+    """
+    Read the .mysubmodules file in modulepath.
+    Return None if there isn't one. Otherwise return [globaloptions, submoduleoptions] where globaloptions is a list and submoduleoptions[submodule] is a list of the options for submodule.
+
+    Format:
+    - Global options are given as a CSV on the first line after GLOBALOPTIONS: i.e. GLOBALOPTIONS:parseforsubmodules
+    - Each submodule is then given on a new line followed by a CSV of any options for that submodule i.e. mysubmodule,no_error_not_found
+    Global options:
+    - parseforsubmodules: parse the files in the module for submodules as well as using the submodules in the file
+    Submodule options:
+    - no_error_not_found: skip the submodule rather than giving an error if there is nowhere to get it from
+    - submodules2: the submodule goes in the submodules2 folder rather than the submodules folder
+    """
+    manifestfile = os.path.join(modulepath, manifestfilename)
+    if not os.path.isfile(manifestfile):
+        return(None)
+
+    with open(manifestfile) as f:
+        lines = [line.strip() for line in f.read().splitlines()]
+    lines = [line for line in lines if line != '']
+
+    globaloptions = []
+    if len(lines) > 0 and lines[0].startswith('GLOBALOPTIONS:'):
+        globaloptions = [option for option in lines[0][len('GLOBALOPTIONS:'): ].split(',') if option != '']
+        lines = lines[1: ]
+    for option in globaloptions:
+        if option not in ['parseforsubmodules']:
+            raise ValueError('Global option not recognised: ' + option + '. Manifest: ' + manifestfile + '.')
+
+    submoduleoptions = {}
+    for line in lines:
+        linesplit = line.split(',')
+        options = [option for option in linesplit[1: ] if option != '']
+        for option in options:
+            if option not in ['no_error_not_found', 'submodules2']:
+                raise ValueError('Submodule option not recognised: ' + option + '. Submodule: ' + linesplit[0] + '. Manifest: ' + manifestfile + '.')
+        submoduleoptions[linesplit[0]] = options
+
+    return([globaloptions, submoduleoptions])
+
+
+def getsubmodules_manifest(modulepath, findsubmodulefunc = None, submodulesavailable = None, manifestfilename = manifestfilename_default):
+    """
+    findsubmodulefunc for dosubmodules that gets the submodules of modulepath from its .mysubmodules file (see readmanifest).
+    Return [submodules1, submodules2].
+
+    If there is a .mysubmodules file without the parseforsubmodules global option then I don't look at any other files in the module so getting the submodules only costs reading one small file.
+    If there is no .mysubmodules file or it has the parseforsubmodules option then I also use findsubmodulefunc(modulepath) i.e. getsubmodules_local.
+
+    submodulesavailable is an optional list/dict of the submodules I can add or a function returning True if I can add a submodule (see getsubmodulesavailable). Submodules with the no_error_not_found option that aren't available are skipped.
+    """
+    manifest = readmanifest(modulepath, manifestfilename = manifestfilename)
+    if manifest is None:
+        if findsubmodulefunc is None:
+            return([[], []])
+        return(findsubmodulefunc(modulepath))
+    globaloptions, submoduleoptions = manifest
+
+    if 'parseforsubmodules' in globaloptions:
+        if findsubmodulefunc is None:
+            raise ValueError('Manifest has parseforsubmodules but no findsubmodulefunc given: ' + modulepath + '.')
+        submodules1, submodules2 = findsubmodulefunc(modulepath)
+        submodules1 = set(submodules1)
+        submodules2 = set(submodules2)
+    else:
+        submodules1 = set()
+        submodules2 = set()
+
+    for submodule in submoduleoptions:
+        if submodulesavailable is not None and 'no_error_not_found' in submoduleoptions[submodule]:
+            if callable(submodulesavailable):
+                available = submodulesavailable(submodule)
+            else:
+                available = submodule in submodulesavailable
+            if available is False:
+                continue
+        if 'submodules2' in submoduleoptions[submodule]:
+            submodules2.add(submodule)
+        else:
+            submodules1.add(submodule)
+
+    return([sorted(submodules1), sorted(submodules2)])
+
+
+def getsubmodulesall(modulepathstodolist, submodulepathdict, submodulename1 = 'submodules', submodulename2 = 'submodules2', submodulecharacters = submodulecharacters_default, filestoparsedict = None, submoduleslistcheck = None, modulescansearchlist = None, scancache = None, workers = None, workertype = 'thread', scanbackend = scanbackend_default, skipbinary = False, maxfilesize = None, includeglobs = None, excludeglobs = None):
+    """
+    Get the submodules for a list of modules and their submodules.
+
+    By default, only consider modules in modulestodolist
+    However, if I only want to consider a limited number of modules and then also do any modules that appear as submodules, I should specify the potential module list as modulescansearchlist
+
+    scancache is an optional cache loaded by loadscancache (see getsubmodulesmulti).
+    workers and workertype allow the files in each module to be parsed by a pool of workers (see scanfilesforsubmodules).
+    scanbackend is 'python' or 'gitgrep' (see getsubmodulesmulti).
+    skipbinary, maxfilesize, includeglobs and excludeglobs allow files to be skipped (see getsubmodulesmulti).
+    """
+    import copy
+
+    if submodulename1 is not None:
+        submodules1dict = {}
+    else:
+        submodules1dict = None
+    if submodulename2 is not None:
+        submodules2dict = {}
+    else:
+        submodules2dict = None
+
+    # codemodulepathdict[modulename] is the path to the folder for modulename where I look for whether there are references to a submodule in a given modulename
+    # should be formed of submoduledict except for the modulepaths I'm doing where it is just the basename
+    codemodulepathdict = copy.deepcopy(submodulepathdict)
+    modulestodolist = []
+    for modulepath in modulepathstodolist:
+        if modulepath[-1] == '/':
+            modulename = os.path.basename(modulepath[: -1])
+        else:
+            modulename = os.path.basename(modulepath)
+        codemodulepathdict[modulename] = modulepath
+        modulestodolist.append(modulename)
+
+    completedmodules = set()
+    while len(modulestodolist) > 0:
+        modulename = modulestodolist.pop(0)
+        # parse for submodulename1 and submodulename2 at the same time so only read each file once
+        submoduleids = [submodulename for submodulename in [submodulename1, submodulename2] if submodulename is not None]
+        if filestoparsedict is not None and modulename in filestoparsedict:
+            filestoparse = filestoparsedict[modulename]
+        else:
+            filestoparse = None
+        with tracephase('getsubmodules', 'scan', module = modulename, path = codemodulepathdict[modulename]):
+            submodulesdict = getsubmodulesmulti(codemodulepathdict[modulename], submoduleids = submoduleids, submodulecharacters = submodulecharacters, filestoparse = filestoparse, submoduleslistcheck = submoduleslistcheck, scancache = scancache, workers = workers, workertype = workertype, scanbackend = scanbackend, skipbinary = skipbinary, maxfilesize = maxfilesize, includeglobs = includeglobs, excludeglobs = excludeglobs)
+        if submodulename1 is not None:
+            submodules1dict[modulename] = submodulesdict[submodulename1]
+        if submodulename2 is not None:
+            submodules2dict[modulename] = submodulesdict[submodulename2]
+
+        completedmodules.add(modulename)
+
+        # submoduleids leaves out submodulename1 or submodulename2 if they are None
+        foundsubmodules = [submodulename for submoduleid in submoduleids for submodulename in submodulesdict[submoduleid]]
+        for submodulename in foundsubmodules:
+            # if this is a module I may add and I wasn't already going through it, I add it to my modulestodolist
+            if submodulename not in completedmodules and submodulename not in modulestodolist and submodulename != modulename:
+                if modulescansearchlist is not None and submodulename in modulescansearchlist:
+                    modulestodolist.append(submodulename)
+                # shouldn't return error since here I'm only parsing modules
+                # should have the option to not parse particular modules
+                # else:
+                #     print('Submodule not parsed from module since not included in modulescansearchlist. Submodule: ' + submodulesname + '. Module: ' + modulename + '.')
+
+    return(submodules1dict, submodules2dict)
+
+
+# Revision Stamps:{{{1
+def getmodulerevision(modulepath, includedirty = True, ignorenames = None):
+    """
+    Get a string that changes whenever the contents of the git repository at modulepath change.
+    Return None if modulepath is not a git repository with a commit.
+
+    This is the HEAD commit. If includedirty is True and there are uncommitted changes (including untracked files), a hash of git status and the size and modification time of each changed file is added.
+    Changed files with any folder or filename in ignorenames are ignored (i.e. I use this for submodules folders that are not copied).
+    Note that changes to git ignored files are not picked up.
+    """
+    import hashlib
+    import subprocess
+
+    try:
+        head = runsubprocess('check_output', ['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd = modulepath, stderr = subprocess.DEVNULL).decode('ascii').strip()
+    except (subprocess.CalledProcessError, OSError):
+        return(None)
+
+    if includedirty is False:
+        return(head)
+
+    # paths given by git status are relative to the root of the repository
+    reporoot = runsubprocess('check_output', ['git', 'rev-parse', '--show-toplevel'], cwd = modulepath).decode('utf-8').strip()
+    statusoutput = runsubprocess('check_output', ['git', 'status', '--porcelain', '-z', '--untracked-files=all'], cwd = modulepath)
+
+    dirtyhash = hashlib.sha1()
+    dirty = False
+    for line in statusoutput.split(b'\0'):
+        if len(line) < 4:
+            # also skips the original name that follows a rename
+            continue
+        filename = os.fsdecode(line[3: ])
+        if ignorenames is not None and any(name in ignorenames for name in filename.split('/')):
+            continue
+        dirty = True
+        dirtyhash.update(line + b'\0')
+        try:
+            st = os.lstat(os.path.join(reporoot, filename))
+            dirtyhash.update((str(st.st_size) + ':' + str(st.st_mtime_ns) + '\0').encode('ascii'))
+        except OSError:
+            dirtyhash.update(b'missing\0')
+
+    if dirty is False:
+        return(head)
+    else:
+        return(head + ':' + dirtyhash.hexdigest())
+
+
+def getsubmodulestamp(sourcepath, method, options, revisiondict = None, ignorenames = None):
+    """
+    Get the stamp I would write to a submodule copied from sourcepath.
+    method is how the submodule is copied (i.e. 'rsync' or 'gitclone') and options are any other arguments that change the copy.
+    A git clone only copies committed files so uncommitted changes to sourcepath are ignored then.
+    revisiondict is an optional dict to save revisions in so I only need to get the revision of each source once during a run.
+    Return None if sourcepath is not a git repository since then I can't tell if it has changed.
+    """
+    includedirty = method != 'gitclone'
+    revision = getsourcerevision(sourcepath, includedirty = includedirty, revisiondict = revisiondict, ignorenames = ignorenames)
+
+    if revision is None:
+        return(None)
+
+    stamp = {'source': os.path.realpath(sourcepath), 'revision': revision, 'method': method, 'options': options}
+    return(stamp)
+
+
+def getsourcerevision(sourcepath, includedirty = True, revisiondict = None, ignorenames = None):
+    """
+    getmodulerevision but save the revision in revisiondict so I only need to get it once during a run.
+    The lockfile and staging folder are always ignored since they change whenever the source is itself a project I add submodules to (see allmodulesinfolder).
+    """
+    if ignorenames is None:
+        ignorenames = [lockfilename_default, stagingfoldername_default]
+    else:
+        ignorenames = list(ignorenames) + [lockfilename_default, stagingfoldername_default]
+
+    revisionkey = (os.path.realpath(sourcepath), includedirty)
+    if revisiondict is not None and revisionkey in revisiondict:
+        return(revisiondict[revisionkey])
+
+    revision = getmodulerevision(sourcepath, includedirty = includedirty, ignorenames = ignorenames)
+    if revisiondict is not None:
+        revisiondict[revisionkey] = revision
+    return(revision)
+
+
+def readsubmodulestamp(submodulepath, stampfilename = stampfilename_default, snapshot = False):
+    """
+    Read the stamp written by writesubmodulestamp. Return None if there is no stamp or it can't be read.
+    The snapshot saved with the stamp is only included if snapshot is True so the stamp can be compared with one from getsubmodulestamp.
+    """
+    import json
+
+    stampfile = os.path.join(submodulepath, stampfilename)
+    if os.path.islink(submodulepath) or not os.path.isfile(stampfile):
+        return(None)
+    try:
+        with open(stampfile) as f:
+            stamp = json.load(f)
+    except Exception:
+        return(None)
+    if snapshot is False and isinstance(stamp, dict):
+        stamp.pop('snapshot', None)
+    return(stamp)
+
+
+def writesubmodulestamp(submodulepath, stamp, stampfilename = stampfilename_default, snapshot = None):
+    """
+    Write stamp to submodulepath. Replace the file rather than writing into it in case it is a hard link.
+    snapshot is optionally saved with the stamp (see getsubmodulesnapshot).
+    """
+    import json
+
+    stampfile = os.path.join(submodulepath, stampfilename)
+    if snapshot is not None:
+        stamp = dict(stamp)
+        stamp['snapshot'] = snapshot
+
+    # submodulepath may be read only
+    dirmode = None
+    if not os.access(submodulepath, os.W_OK):
+        dirmode = os.stat(submodulepath).st_mode
+        os.chmod(submodulepath, 0o755)
+
+    with open(stampfile + '.tmp', 'w') as f:
+        json.dump(stamp, f)
+    os.replace(stampfile + '.tmp', stampfile)
+
+    if dirmode is not None:
+        os.chmod(submodulepath, dirmode)
+
+
+def excludestampfile(submodulepath, stampfilename = stampfilename_default):
+    """
+    Add the stamp to info/exclude of the git checkout at submodulepath if it isn't already there so it doesn't show up as untracked in git status.
+    A worktree checkout has a .git file so I ask git where info/exclude is (it is shared with the mirror).
+    """
+    if os.path.isdir(os.path.join(submodulepath, '.git')):
+        excludefile = os.path.join(submodulepath, '.git', 'info', 'exclude')
+    else:
+        excludefile = os.path.join(submodulepath, runsubprocess('check_output', ['git', 'rev-parse', '--git-path', 'info/exclude'], cwd = submodulepath).decode('utf-8').strip())
+
+    line = '/' + stampfilename
+    if os.path.isfile(excludefile):
+        with open(excludefile) as f:
+            text = f.read()
+        if line in text.splitlines():
+            return(None)
+    else:
+        os.makedirs(os.path.dirname(excludefile), exist_ok = True)
+        text = ''
+    with open(excludefile, 'a') as f:
+        if len(text) > 0 and not text.endswith('\n'):
+            f.write('\n')
+        f.write(line + '\n')
+
+
+def getsubmodulesnapshot(submodulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2'):
+    """
+    Get the size and modification time of every file in the copy of a submodule at submodulepath so I can later tell if the copy has been changed without reading it (see getsubmodulesstatus).
+    The submodules folders, .git and the stamp are left out.
+
+    Return snapshot where snapshot[relpath] = [size, modification time in ns] for files and ['link', target] for symlinks.
+    """
+    import stat
+
+    excludepatterns = getsubmoduleexcludepatterns(submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = False) + ['.git', '/' + stampfilename_default]
+
+    snapshot = {}
+    todo = ['']
+    while len(todo) > 0:
+        reldir = todo.pop()
+        with os.scandir(os.path.join(submodulepath, reldir)) as it:
+            entries = list(it)
+        for entry in entries:
+            relpath = os.path.join(reldir, entry.name)
+            isdir = entry.is_dir(follow_symlinks = False)
+            if isrsyncexcluded(relpath, isdir, excludepatterns):
+                continue
+            if isdir:
+                todo.append(relpath)
+            elif entry.is_symlink():
+                snapshot[relpath] = ['link', os.readlink(entry.path)]
+            else:
+                entrystat = entry.stat(follow_symlinks = False)
+                if stat.S_ISREG(entrystat.st_mode):
+                    snapshot[relpath] = [entrystat.st_size, entrystat.st_mtime_ns]
+    return(snapshot)
+
+
+# Lockfile:{{{1
+def readlockfile(modulepath, lockfilename = lockfilename_default):
+    """
+    Read the lockfile written by writelockfile. Return None if there is no lockfile or it can't be read.
+    """
+    import json
+
+    lockfile = os.path.join(modulepath, lockfilename)
+    if not os.path.isfile(lockfile):
+        return(None)
+    try:
+        with open(lockfile) as f:
+            lock = json.load(f)
+    except Exception:
+        return(None)
+    if not isinstance(lock, dict) or lock.get('version') != lockfileversion:
+        return(None)
+    return(lock)
+
+
+def writelockfile(modulepath, lock, lockfilename = lockfilename_default):
+    import json
+
+    lockfile = os.path.join(modulepath, lockfilename)
+    with open(lockfile + '.tmp', 'w') as f:
+        json.dump(lock, f, indent = 1, sort_keys = True)
+    os.replace(lockfile + '.tmp', lockfile)
+
+
+def normaliselockoptions(options):
+    """
+    Get options as they are after being saved in the lockfile as JSON so they can be compared with the options in a lockfile.
+    Lists, tuples and sets are sorted lists since only which items they contain matters (i.e. modulescansearchlist, includeglobs) and dict keys are strings.
+    """
+    if isinstance(options, dict):
+        return({str(key): normaliselockoptions(options[key]) for key in options})
+    if isinstance(options, (list, tuple, set, frozenset)):
+        return(sorted(normaliselockoptions(item) for item in options))
+    return(options)
+
+
+def getlockfile(modulepath, options, lockentries, submodulename1 = 'submodules', submodulename2 = 'submodules2', lockfilename = lockfilename_default):
+    """
+    Get the lockfile for the project at modulepath.
+
+    options are the arguments that change which submodules are added and how. They are saved as normaliselockoptions(options).
+    lockentries[submodulepath] = [submodule, sourcepath, revision] for every submodule added in the run (see addsubmodules_local). Only the ones in modulepath are used.
+
+    The lockfile records the revision of the project itself (ignoring the submodules folders and the lockfile) and for each submodule its path relative to modulepath, the source it was copied from and the revision of that source.
+    Return None if a revision can't be found since then I can't tell later whether anything has changed.
+    """
+    modulepath = os.path.abspath(modulepath) + '/'
+
+    revision = getmodulerevision(modulepath, ignorenames = [submodulename1, submodulename2, lockfilename])
+    if revision is None:
+        return(None)
+
+    submodules = {}
+    for submodulepath in lockentries:
+        submodulepathabs = os.path.abspath(submodulepath) + '/'
+        if not submodulepathabs.startswith(modulepath):
+            continue
+        submodule, sourcepath, sourcerevision = lockentries[submodulepath]
+        if sourcerevision is None:
+            return(None)
+        submodules[submodulepathabs[len(modulepath): ]] = {'submodule': submodule, 'source': os.path.realpath(sourcepath), 'revision': sourcerevision}
+
+    lock = {'version': lockfileversion, 'options': normaliselockoptions(options), 'revision': revision, 'submodules': submodules}
+    return(lock)
+
+
+def checklockfile(modulepath, options, submodulepathdict, includedirty = True, revisiondict = None, submodulename1 = 'submodules', submodulename2 = 'submodules2', lockfilename = lockfilename_default):
+    """
+    Check whether the lockfile in modulepath still matches i.e. so I can skip getting the submodules for modulepath.
+    This is the case if the options are the same, the project and every source have the same revision, every submodule still comes from the same source and every submodule folder exists.
+    So the check costs getting the revision of each source rather than parsing any files.
+    includedirty is as in getmodulerevision for the sources.
+    """
+    lock = readlockfile(modulepath, lockfilename = lockfilename)
+    if lock is None:
+        return(False)
+    if lock['options'] != normaliselockoptions(options):
+        return(False)
+
+    revision = getmodulerevision(modulepath, ignorenames = [submodulename1, submodulename2, lockfilename])
+    if revision is None or revision != lock['revision']:
+        return(False)
+
+    for relpath in lock['submodules']:
+        entry = lock['submodules'][relpath]
+        if entry['submodule'] not in submodulepathdict or os.path.realpath(submodulepathdict[entry['submodule']]) != entry['source']:
+            return(False)
+        if not os.path.isdir(os.path.join(modulepath, relpath)):
+            return(False)
+        sourcerevision = getsourcerevision(entry['source'], includedirty = includedirty, revisiondict = revisiondict, ignorenames = [submodulename1, submodulename2])
+        if sourcerevision is None or sourcerevision != entry['revision']:
+            return(False)
+
+    return(True)
+
+
+# Tree Sync:{{{1
+def isrsyncexcluded(relpath, isdir, excludepatterns):
+    """
+    Check whether relpath (relative to the top of the sync) matches any of excludepatterns in the way rsync --exclude does for simple patterns:
+    - a pattern with no / matches the name of a file or folder at any depth i.e. 'submodules'
+    - a pattern with a / in the middle matches the end of relpath i.e. '.git/*' matches everything directly in any .git folder
+    - a pattern starting with / only matches from the top of the sync i.e. '/.mysubmodules_stamp'
+    - a pattern ending with / only matches folders
+    * and ? do not match /.
+    """
+    import fnmatch
+
+    parts = relpath.split('/')
+    for pattern in excludepatterns:
+        if pattern.endswith('/'):
+            if isdir is False:
+                continue
+            pattern = pattern[: -1]
+        anchored = pattern.startswith('/')
+        patternparts = pattern.lstrip('/').split('/')
+        if anchored is True:
+            if len(parts) != len(patternparts):
+                continue
+            candidateparts = parts
+        else:
+            if len(parts) < len(patternparts):
+                continue
+            candidateparts = parts[len(parts) - len(patternparts): ]
+        if all(fnmatch.fnmatchcase(part, patternpart) for part, patternpart in zip(candidateparts, patternparts)):
+            return(True)
+    return(False)
+
+
+def synctree(sourcepath, destpath, filefunc, excludepatterns = None, delete = True, deleteexcluded = False, dirmode = None, protectpatterns = None):
+    """
+    Make destpath a copy of the contents of sourcepath in the same way as rsync -a sourcepath/ destpath (with --delete if delete is True).
+    Excluded files (see isrsyncexcluded) are not copied. They are not deleted from destpath unless deleteexcluded is True.
+    Files matching protectpatterns are never copied or deleted (like rsync --filter 'P PATTERN').
+
+    Folders and symlinks are created here. Files are copied by filefunc(sourcefile, sourcestat, destfile, deststat) where deststat is the lstat of destfile or None if it doesn't exist. filefunc should return the number of bytes it copied.
+    Folders get the same permissions as in sourcepath (or dirmode if it is given) but are made writable while I go through them.
+
+    Return [number of files copied, bytes copied].
+    """
+    import stat
+
+    if excludepatterns is None:
+        excludepatterns = []
+    if protectpatterns is None:
+        protectpatterns = []
+
+    filescopied = 0
+    bytescopied = 0
+
+    # folders to go through relative to sourcepath ('' is the top)
+    # I set folder permissions at the end so I can still write in them while I sync
+    dirmodes = []
+    tosync = ['']
+    while len(tosync) > 0:
+        reldir = tosync.pop()
+        sourcedir = os.path.join(sourcepath, reldir)
+        destdir = os.path.join(destpath, reldir)
+
+        sourcedirstat = os.stat(sourcedir)
+        if os.path.islink(destdir) or (os.path.lexists(destdir) and not os.path.isdir(destdir)):
+            rmrecursive(destdir)
+        if not os.path.isdir(destdir):
+            os.mkdir(destdir)
+        if not os.access(destdir, os.W_OK | os.X_OK):
+            os.chmod(destdir, 0o755)
+        if dirmode is None:
+            dirmodes.append([destdir, stat.S_IMODE(sourcedirstat.st_mode)])
+        else:
+            dirmodes.append([destdir, dirmode])
+
+        keepnames = set()
+        with os.scandir(sourcedir) as it:
+            entries = list(it)
+        for entry in entries:
+            relpath = os.path.join(reldir, entry.name)
+            isdir = entry.is_dir(follow_symlinks = False)
+            if isrsyncexcluded(relpath, isdir, excludepatterns) or isrsyncexcluded(relpath, isdir, protectpatterns):
+                continue
+            keepnames.add(entry.name)
+            destentry = os.path.join(destdir, entry.name)
+
+            try:
+                deststat = os.lstat(destentry)
+            except FileNotFoundError:
+                deststat = None
+
+            if entry.is_symlink():
+                linkto = os.readlink(entry.path)
+                if deststat is not None and stat.S_ISLNK(deststat.st_mode) and os.readlink(destentry) == linkto:
+                    continue
+                if deststat is not None:
+                    rmrecursive(destentry)
+                os.symlink(linkto, destentry)
+            elif isdir:
+                tosync.append(relpath)
+            elif entry.is_file(follow_symlinks = False):
+                if deststat is not None and stat.S_ISDIR(deststat.st_mode):
+                    rmrecursive(destentry)
+                    deststat = None
+                copied = filefunc(entry.path, entry.stat(follow_symlinks = False), destentry, deststat)
+                if copied is not None:
+                    filescopied = filescopied + 1
+                    bytescopied = bytescopied + copied
+
+        if delete is True:
+            for name in os.listdir(destdir):
+                if name in keepnames:
+                    continue
+                relpath = os.path.join(reldir, name)
+                destentry = os.path.join(destdir, name)
+                isdir = os.path.isdir(destentry) and not os.path.islink(destentry)
+                if isrsyncexcluded(relpath, isdir, protectpatterns):
+                    continue
+                if deleteexcluded is False and isrsyncexcluded(relpath, isdir, excludepatterns):
+                    continue
+                rmrecursive(destentry)
+
+    # set folder permissions from the bottom up so I can still get into folders while setting them
+    for destdir, mode in reversed(dirmodes):
+        os.chmod(destdir, mode)
+
+    tracecount('filescopied', filescopied)
+    tracecount('bytescopied', bytescopied)
+    return([filescopied, bytescopied])
+
+
+def getsubmoduleexcludepatterns(submodulename1 = 'submodules', submodulename2 = 'submodules2', rsync_gitskip = True):
+    """
+    Get the rsync style exclude patterns I use when copying a submodule.
+    """
+    excludepatterns = []
+    if submodulename1 is not None:
+        excludepatterns.append(submodulename1)
+    if submodulename2 is not None:
+        excludepatterns.append(submodulename2)
+    # skip stuff in .git/ folder since if I already have my main local version of the git folder
+    if rsync_gitskip is True:
+        excludepatterns.append('.git/*')
+    # the source may be a project that is partway through a staged run
+    excludepatterns.append('/' + stagingfoldername_default)
+    return(excludepatterns)
+
+
+def copyfiledata(sourcefd, destfd):
+    """
+    Copy everything from the current position of sourcefd to destfd.
+    Use copy_file_range (so the kernel can copy without going through Python and the filesystem can share blocks) and fall back to sendfile and then to reading and writing if these are not supported.
+    Return the number of bytes copied.
+    """
+    import errno
+
+    blocksize = 8 * 1024 * 1024
+    copied = 0
+    for funcname in ['copy_file_range', 'sendfile']:
+        if not hasattr(os, funcname):
+            continue
+        try:
+            while True:
+                if funcname == 'copy_file_range':
+                    thiscopied = os.copy_file_range(sourcefd, destfd, blocksize)
+                else:
+                    thiscopied = os.sendfile(destfd, sourcefd, None, blocksize)
+                if thiscopied == 0:
+                    return(copied)
+                copied = copied + thiscopied
+        except OSError as e:
+            # only fall back if nothing has been copied yet so I don't write anything twice
+            if copied > 0 or e.errno not in [errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EPERM]:
+                raise
+
+    while True:
+        data = os.read(sourcefd, blocksize)
+        if len(data) == 0:
+            return(copied)
+        os.write(destfd, data)
+        copied = copied + len(data)
+
+
+def copyfilenative(sourcefile, sourcestat, destfile, deststat, filemode = None):
+    """
+    filefunc for synctree that copies sourcefile to destfile like rsync -a.
+    destfile is not copied if it has the same size and modification time as sourcefile (the same quick check as rsync) though its permissions are still updated.
+    Permissions are copied from sourcefile unless filemode is given.
+    Return the number of bytes copied or None if destfile was already up to date.
+    """
+    import stat
+
+    if filemode is None:
+        filemode = stat.S_IMODE(sourcestat.st_mode)
+
+    if deststat is not None and stat.S_ISREG(deststat.st_mode) and deststat.st_size == sourcestat.st_size and deststat.st_mtime_ns == sourcestat.st_mtime_ns:
+        if stat.S_IMODE(deststat.st_mode) != filemode:
+            os.chmod(destfile, filemode)
+        return(None)
+
+    # copy to a temporary file and rename so destfile is never partially written
+    tmpfile = destfile + '.mysubmodules_tmp'
+    if os.path.lexists(tmpfile):
+        os.remove(tmpfile)
+    sourcefd = os.open(sourcefile, os.O_RDONLY)
+    try:
+        destfd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            copied = copyfiledata(sourcefd, destfd)
+        finally:
+            os.close(destfd)
+    finally:
+        os.close(sourcefd)
+    os.chmod(tmpfile, filemode)
+    os.utime(tmpfile, ns = (sourcestat.st_atime_ns, sourcestat.st_mtime_ns))
+    os.replace(tmpfile, destfile)
+
+    return(copied)
+
+
+def syncsubmodule(sourcepath, submodulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', rsync_gitskip = True, deleteexcluded = False, usestamps = False, syncbackend = syncbackend_default, readonly = False):
+    """
+    Make submodulepath a copy of sourcepath without the submodules folders (and without the contents of .git/ if rsync_gitskip is True).
+    Files removed from sourcepath are deleted from submodulepath. Excluded files are only deleted if deleteexcluded and rsync_gitskip are True.
+    If usestamps is True, the stamp in submodulepath is neither copied nor deleted.
+
+    syncbackend:
+    - 'rsync': run rsync
+    - 'native': copy in Python with synctree and copyfilenative
+    Both give the same result since both use the patterns from getsubmoduleexcludepatterns.
+
+    readonly makes the copy read only. With 'native' this is done as the files are copied. With 'rsync' I chmod everything afterwards.
+    """
+    # sourcepath must end with / so rsync copies the contents of sourcepath rather than sourcepath itself
+    sourcepath = os.path.join(sourcepath, '')
+    excludepatterns = getsubmoduleexcludepatterns(submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip)
+    # don't copy or delete the stamp
+    if usestamps is True:
+        protectpatterns = ['/' + stampfilename_default]
+    else:
+        protectpatterns = []
+    # --delete-excluded is only used with rsync_gitskip
+    deleteexcluded = deleteexcluded is True and rsync_gitskip is True
+
+    if syncbackend == 'rsync':
+        rsynclist = ['rsync', '-a', '--delete', sourcepath, submodulepath]
+        for pattern in excludepatterns:
+            rsynclist = rsynclist + ['--exclude', pattern]
+        if deleteexcluded is True:
+            rsynclist = rsynclist + ['--delete-excluded']
+        for pattern in protectpatterns:
+            rsynclist = rsynclist + ['--filter', 'P ' + pattern, '--exclude', pattern]
+        if tracer is None:
+            runsubprocess('check_call', rsynclist)
+        else:
+            # get rsync to tell me how much it copied
+            output = runsubprocess('check_output', rsynclist + ['--stats'], universal_newlines = True)
+            for line in output.splitlines():
+                if line.startswith('Total transferred file size:'):
+                    tracecount('bytescopied', int(line.split(':')[1].split()[0].replace(',', '')))
+                if line.startswith('Number of regular files transferred:'):
+                    tracecount('filescopied', int(line.split(':')[1].split()[0].replace(',', '')))
+
+        if readonly is True:
+            chmodrecursive(submodulepath, 0o555)
+    elif syncbackend == 'native':
+        if readonly is True:
+            filefunc = functools.partial(copyfilenative, filemode = 0o555)
+            dirmode = 0o555
+        else:
+            filefunc = copyfilenative
+            dirmode = None
+        synctree(sourcepath, submodulepath, filefunc, excludepatterns = excludepatterns, deleteexcluded = deleteexcluded, dirmode = dirmode, protectpatterns = protectpatterns)
+    else:
+        raise ValueError('syncbackend not recognised: ' + str(syncbackend) + '.')
+
+
+# Content Store:{{{1
+def loadstoreindex(storepath):
+    """
+    Load the index of file hashes for the store at storepath.
+    storeindex[filename] = [inode, size, mtime, sha256] so I only need to hash files that have changed.
+    """
+    import json
+
+    indexfile = os.path.join(storepath, 'index.json')
+    if os.path.isfile(indexfile):
+        try:
+            with open(indexfile) as f:
+                return(json.load(f))
+        except Exception:
+            print('Store index could not be read so ignored: ' + indexfile + '.')
+    return({})
+
+
+def savestoreindex(storepath, storeindex):
+    import json
+
+    os.makedirs(storepath, exist_ok = True)
+    indexfile = os.path.join(storepath, 'index.json')
+    with open(indexfile + '.tmp', 'w') as f:
+        json.dump(storeindex, f)
+    os.replace(indexfile + '.tmp', indexfile)
+
+
+def addtostore(storepath, filename, filestat, storeindex = None):
+    """
+    Add the contents of filename to the content-addressed store at storepath if they are not there already and return the path of the object in the store.
+    Objects are named by the sha256 of their contents (with .x on the end for executable files) and are read only so they can be shared by hard links.
+    """
+    import hashlib
+    import shutil
+    import uuid
+
+    statkey = [filestat.st_ino, filestat.st_size, filestat.st_mtime_ns]
+    if storeindex is not None and filename in storeindex and storeindex[filename][: 3] == statkey:
+        digest = storeindex[filename][3]
+    else:
+        filehash = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                filehash.update(chunk)
+        digest = filehash.hexdigest()
+        if storeindex is not None:
+            storeindex[filename] = statkey + [digest]
+
+    executable = filestat.st_mode & 0o111 != 0
+    if executable is True:
+        objectpath = os.path.join(storepath, 'objects', digest[: 2], digest + '.x')
+    else:
+        objectpath = os.path.join(storepath, 'objects', digest[: 2], digest)
+
+    if not os.path.exists(objectpath):
+        os.makedirs(os.path.dirname(objectpath), exist_ok = True)
+        os.makedirs(os.path.join(storepath, 'tmp'), exist_ok = True)
+        # copy to a temporary file and rename so other processes never see a partial object
+        tmpfile = os.path.join(storepath, 'tmp', uuid.uuid4().hex)
+        shutil.copyfile(filename, tmpfile)
+        if executable is True:
+            os.chmod(tmpfile, 0o555)
+        else:
+            os.chmod(tmpfile, 0o444)
+        os.replace(tmpfile, objectpath)
+
+    return(objectpath)
+
+
+def reflinkfile(sourcefile, destfile):
+    """
+    Make destfile a copy-on-write clone of sourcefile (only works on filesystems like btrfs and xfs).
+    Raise OSError if this isn't possible.
+    """
+    import fcntl
+
+    # FICLONE from linux/fs.h
+    ficlone = 0x40049409
+    with open(sourcefile, 'rb') as fsource:
+        with open(destfile, 'wb') as fdest:
+            fcntl.ioctl(fdest.fileno(), ficlone, fsource.fileno())
+
+
+def linkfilefromstore(sourcefile, sourcestat, destfile, deststat, storepath, linkmode, storeindex = None, readonly = False):
+    """
+    filefunc for synctree that adds sourcefile to the store and then makes destfile from the store object.
+    linkmode:
+    - 'hardlink': destfile is a hard link to the store object
+    - 'reflink': destfile is a copy-on-write clone of the store object
+    - 'copy': destfile is a normal copy of the store object
+    - 'reflinkorcopy': reflink if the filesystem supports it and otherwise copy
+    Return the number of bytes copied or None if destfile was already up to date.
+    """
+    import shutil
+    import stat
+
+    objectpath = addtostore(storepath, sourcefile, sourcestat, storeindex = storeindex)
+    tmpfile = destfile + '.mysubmodules_tmp'
+
+    if linkmode == 'hardlink':
+        objectstat = os.stat(objectpath)
+        if deststat is not None and deststat.st_ino == objectstat.st_ino and deststat.st_dev == objectstat.st_dev:
+            return(None)
+        if os.path.lexists(tmpfile):
+            os.remove(tmpfile)
+        os.link(objectpath, tmpfile)
+    else:
+        # same check as rsync to see if the file has changed
+        if deststat is not None and stat.S_ISREG(deststat.st_mode) and deststat.st_size == sourcestat.st_size and deststat.st_mtime_ns == sourcestat.st_mtime_ns:
+            return(None)
+        if os.path.lexists(tmpfile):
+            os.remove(tmpfile)
+        copied = False
+        if linkmode in ['reflink', 'reflinkorcopy']:
+            try:
+                reflinkfile(objectpath, tmpfile)
+                copied = True
+            except OSError:
+                if linkmode == 'reflink':
+                    raise
+        if copied is False:
+            shutil.copyfile(objectpath, tmpfile)
+        if readonly is True:
+            os.chmod(tmpfile, 0o555)
+        else:
+            os.chmod(tmpfile, stat.S_IMODE(sourcestat.st_mode))
+        os.utime(tmpfile, ns = (sourcestat.st_atime_ns, sourcestat.st_mtime_ns))
+
+    # replace rather than write over destfile in case it is a hard link to something else
+    os.replace(tmpfile, destfile)
+
+    return(sourcestat.st_size)
+
+
+def addsubmodule_store(sourcepath, submodulepath, storepath, excludepatterns, deleteexcluded = False, readonly = False, linkmode = 'auto', storeindex = None, protectpatterns = None):
+    """
+    Copy the submodule at sourcepath to submodulepath through the content-addressed store at storepath.
+    Each distinct file is only saved once in the store however many submodules folders it appears in.
+
+    linkmode is as in linkfilefromstore or 'auto'.
+    'auto' uses hard links when readonly is True (so disk use and copy time scale with unique content) and otherwise reflinks where possible and copies where not (so editing a copy can't change the store).
+    Hard links require readonly since every hard link to an object is the same file.
+    excludepatterns, deleteexcluded and protectpatterns are as in synctree.
+    If a hard link fails (e.g. since the store is on a different filesystem) then 'auto' falls back to reflinks/copies.
+
+    Return [number of files copied, bytes copied].
+    """
+    if linkmode == 'auto':
+        if readonly is True:
+            linkmode = 'hardlink'
+        else:
+            linkmode = 'reflinkorcopy'
+    if linkmode == 'hardlink' and readonly is not True:
+        raise ValueError('linkmode hardlink requires readonly = True since every hard link to a store object is the same file.')
+    if linkmode not in ['hardlink', 'reflink', 'copy', 'reflinkorcopy']:
+        raise ValueError('linkmode not recognised: ' + str(linkmode) + '.')
+
+    # files are made read only by linkfilefromstore (store objects are always read only) so only need to set folders
+    if readonly is True:
+        dirmode = 0o555
+    else:
+        dirmode = None
+
+    filefunc = functools.partial(linkfilefromstore, storepath = storepath, linkmode = linkmode, storeindex = storeindex, readonly = readonly)
+    try:
+        stats = synctree(sourcepath, submodulepath, filefunc, excludepatterns = excludepatterns, deleteexcluded = deleteexcluded, dirmode = dirmode, protectpatterns = protectpatterns)
+    except OSError as e:
+        import errno
+        if linkmode == 'hardlink' and e.errno == errno.EXDEV:
+            filefunc = functools.partial(linkfilefromstore, storepath = storepath, linkmode = 'reflinkorcopy', storeindex = storeindex, readonly = readonly)
+            stats = synctree(sourcepath, submodulepath, filefunc, excludepatterns = excludepatterns, deleteexcluded = deleteexcluded, dirmode = dirmode, protectpatterns = protectpatterns)
+        else:
+            raise
+
+    return(stats)
+
+
+# Mirror Cache:{{{1
+def getmirrorpath(mirrorcachedir, url):
+    """
+    Get the path of the bare mirror of url in mirrorcachedir.
+    The name includes a hash of url so different repositories with the same name don't clash.
+    """
+    import hashlib
+
+    name = os.path.basename(url.rstrip('/'))
+    if name.endswith('.git'):
+        name = name[: -4]
+    return(os.path.join(mirrorcachedir, name + '_' + hashlib.sha1(url.encode('utf-8')).hexdigest()[: 12] + '.git'))
+
+
+def getmirror(mirrorcachedir, url, refresh = False, clonefilter = None, mirrordict = None):
+    """
+    Get the path of a bare mirror of url in mirrorcachedir, creating it with git clone --mirror if it doesn't exist.
+
+    If refresh is True, fetch changes to an existing mirror. Otherwise the mirror is used as it is.
+    mirrordict is an optional dict so I only create/fetch each mirror once during a run.
+    clonefilter is a partial clone filter i.e. 'blob:none' used when creating the mirror so it only fetches blobs when they're needed (only works with servers that allow filters).
+    """
+    import uuid
+
+    mirrorpath = getmirrorpath(mirrorcachedir, url)
+    if mirrordict is not None and url in mirrordict:
+        return(mirrordict[url])
+
+    with mirrorlock:
+        if mirrorpath not in mirrorlocks:
+            mirrorlocks[mirrorpath] = threading.Lock()
+        thislock = mirrorlocks[mirrorpath]
+
+    with thislock:
+        if mirrordict is not None and url in mirrordict:
+            return(mirrordict[url])
+
+        if not os.path.isdir(mirrorpath):
+            os.makedirs(mirrorcachedir, exist_ok = True)
+            # clone to a temporary folder and rename so other processes never see a partial mirror
+            tmppath = mirrorpath + '_' + uuid.uuid4().hex + '.tmp'
+            clonelist = ['git', 'clone', '--quiet', '--mirror']
+            if clonefilter is not None:
+                clonelist = clonelist + ['--filter=' + clonefilter]
+            runsubprocess('check_call', clonelist + [url, tmppath])
+            try:
+                os.rename(tmppath, mirrorpath)
+            except OSError:
+                # another process created the mirror first
+                if not os.path.isdir(mirrorpath):
+                    raise
+                rmrecursive(tmppath)
+        elif refresh is True:
+            runsubprocess('check_call', ['git', '-C', mirrorpath, 'fetch', '--quiet', '--prune', 'origin'])
+
+        if mirrordict is not None:
+            mirrordict[url] = mirrorpath
+
+    return(mirrorpath)
+
+
+def gitclonesubmodule(url, submodulepath, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, mirrordict = None):
+    """
+    git clone url to submodulepath.
+
+    If mirrorcachedir is given, keep a bare mirror of url in mirrorcachedir (see getmirror) and clone using it so repeated clones of the same module don't need to transfer all the objects again.
+    clonemode:
+    - 'reference': git clone --reference mirror url. Only objects missing from the mirror are fetched from url so the clone is always up to date.
+    - 'shared': git clone --shared mirror and then set origin to url. Nothing is fetched from url so the clone is only as up to date as the mirror.
+    - 'worktree': git worktree add from the mirror. Again the checkout is only as up to date as the mirror. Note the checkout has a .git file rather than a .git/ folder.
+    Use mirrorrefresh = True to fetch changes to the mirrors.
+
+    clonedepth gives a shallow clone with that many commits (only with clonemode = 'reference' or without mirrorcachedir).
+    clonefilter is a partial clone filter i.e. 'blob:none' (see getmirror).
+    """
+    if clonedepth is not None and mirrorcachedir is not None and clonemode != 'reference':
+        raise ValueError('clonedepth only works with clonemode reference: ' + str(clonemode) + '.')
+
+    # git ignores --depth for clones from a local path so need to clone with file://
+    if clonedepth is not None and os.path.isdir(url):
+        cloneurl = 'file://' + os.path.abspath(url)
+    else:
+        cloneurl = url
+
+    if mirrorcachedir is None:
+        clonelist = ['git', 'clone', '--quiet']
+        if clonedepth is not None:
+            clonelist = clonelist + ['--depth', str(clonedepth)]
+        if clonefilter is not None:
+            clonelist = clonelist + ['--filter=' + clonefilter]
+        runsubprocess('check_call', clonelist + [cloneurl, submodulepath])
+        return(None)
+
+    mirrorpath = getmirror(mirrorcachedir, url, refresh = mirrorrefresh, clonefilter = clonefilter, mirrordict = mirrordict)
+
+    if clonemode == 'reference':
+        clonelist = ['git', 'clone', '--quiet', '--reference', mirrorpath]
+        if clonedepth is not None:
+            clonelist = clonelist + ['--depth', str(clonedepth)]
+        runsubprocess('check_call', clonelist + [cloneurl, submodulepath])
+    elif clonemode == 'shared':
+        runsubprocess('check_call', ['git', 'clone', '--quiet', '--shared', mirrorpath, submodulepath])
+        runsubprocess('check_call', ['git', '-C', submodulepath, 'remote', 'set-url', 'origin', url])
+    elif clonemode == 'worktree':
+        mirrorlocks[mirrorpath].acquire()
+        try:
+            # forget worktrees that have been deleted
+            runsubprocess('check_call', ['git', '-C', mirrorpath, 'worktree', 'prune'])
+            runsubprocess('check_call', ['git', '-C', mirrorpath, 'worktree', 'add', '--quiet', '--detach', os.path.abspath(submodulepath)])
+        finally:
+            mirrorlocks[mirrorpath].release()
+    else:
+        raise ValueError('clonemode not recognised: ' + str(clonemode) + '.')
+
+
+# Staging:{{{1
+def getstagingpath(modulepath, stagingfoldername = stagingfoldername_default):
+    """
+    Get the folder where the submodules folders of the project at modulepath are built in a staged run.
+    This is in the project so it is on the same filesystem and ends with the name of the project so getmodulename gives the same name for it.
+    """
+    return(os.path.join(modulepath, stagingfoldername, getmodulename(modulepath), ''))
+
+
+def hardlinktree(sourcepath, destpath):
+    """
+    Make destpath a copy of sourcepath where every file is a hard link to the file in sourcepath. Symlinks are copied as symlinks.
+    Files that can't be hard linked are copied.
+
+    This is only safe since I never write into a file in a submodule - copyfilenative, rsync and writesubmodulestamp write a new file and rename it over the old one.
+    """
+    import shutil
+    import stat
+
+    os.mkdir(destpath)
+    dirmodes = [[destpath, stat.S_IMODE(os.stat(sourcepath).st_mode)]]
+    for root, dirs, files in os.walk(sourcepath):
+        destroot = os.path.join(destpath, os.path.relpath(root, sourcepath))
+        for name in dirs + files:
+            sourcename = os.path.join(root, name)
+            destname = os.path.join(destroot, name)
+            if os.path.islink(sourcename):
+                os.symlink(os.readlink(sourcename), destname)
+            elif os.path.isdir(sourcename):
+                os.mkdir(destname)
+                dirmodes.append([destname, stat.S_IMODE(os.stat(sourcename).st_mode)])
+            else:
+                try:
+                    os.link(sourcename, destname)
+                except OSError:
+                    shutil.copy2(sourcename, destname)
+
+    # set the folder permissions last since the folders may be read only
+    for destname, dirmode in reversed(dirmodes):
+        os.chmod(destname, dirmode)
+
+
+def preparestaging(modulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', printdetails = False):
+    """
+    Set up the staging folder for the project at modulepath (see getstagingpath) and return its path.
+
+    The current submodules folders are hard linked into the staging folder so submodules that haven't changed don't need to be copied again.
+    If the staging folder is already there then an earlier run was interrupted and I carry on from where it stopped.
+    """
+    stagingpath = getstagingpath(modulepath)
+    if os.path.isdir(stagingpath):
+        if printdetails is True:
+            print(str(datetime.datetime.now()) + ': Resuming from staging folder: ' + stagingpath + '.')
+        return(stagingpath)
+
+    # build in a temporary folder so an interrupted prefill is not mistaken for an interrupted run
+    prefillpath = stagingpath[: -1] + '.prefill'
+    if os.path.lexists(prefillpath):
+        rmrecursive(prefillpath)
+    os.makedirs(prefillpath)
+    with tracephase('preparestaging', 'phase', modulepath = modulepath):
+        for submodulename in [submodulename1, submodulename2]:
+            if os.path.isdir(os.path.join(modulepath, submodulename)) and not os.path.islink(os.path.join(modulepath, submodulename)):
+                hardlinktree(os.path.join(modulepath, submodulename), os.path.join(prefillpath, submodulename))
+    os.rename(prefillpath, stagingpath)
+
+    return(stagingpath)
+
+
+def exchangepaths(path1, path2):
+    """
+    Swap path1 and path2 in one step with renameat2 and RENAME_EXCHANGE.
+    Return False if this isn't supported (it needs Linux and a filesystem that supports it) so the caller can fall back to renames.
+    """
+    import ctypes
+    import errno
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno = True).renameat2
+    except (OSError, AttributeError):
+        return(False)
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+
+    # AT_FDCWD = -100, RENAME_EXCHANGE = 2
+    if renameat2(-100, os.fsencode(path1), -100, os.fsencode(path2), 2) == 0:
+        return(True)
+    error = ctypes.get_errno()
+    if error in [errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP]:
+        return(False)
+    raise OSError(error, os.strerror(error), path1)
+
+
+def swapstaging(modulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', trashdir = None):
+    """
+    Swap the submodules folders built in the staging folder of modulepath into the project and then delete the staging folder with the old submodules folders.
+    Each submodules folder is swapped with one rename so the project is never left with a half updated submodules folder.
+    """
+    stagingpath = getstagingpath(modulepath)
+    traceevent = tracebegin('swapstaging', 'phase', modulepath = modulepath)
+    for submodulename in [submodulename1, submodulename2]:
+        livepath = os.path.join(modulepath, submodulename)
+        stagedpath = os.path.join(stagingpath, submodulename)
+        if os.path.lexists(stagedpath) and os.path.lexists(livepath):
+            if exchangepaths(stagedpath, livepath) is False:
+                # fall back to moving the old folder out of the way first
+                os.rename(livepath, stagedpath + '.old')
+                os.rename(stagedpath, livepath)
+        elif os.path.lexists(stagedpath):
+            os.rename(stagedpath, livepath)
+        elif os.path.lexists(livepath):
+            # the project no longer needs this folder
+            os.rename(livepath, stagedpath)
+    traceend(traceevent)
+
+    rmrecursive(os.path.join(modulepath, stagingfoldername_default), trashdir = trashdir)
+
+
+# Run Tasks:{{{1
+def runsubmoduletasks(tasks, workers = None, failedtaskkeys = None):
+    """
+    Run a list of tasks where each task is [taskkey, dependson, func, description].
+    func() is only run once the task with taskkey equal to dependson has finished successfully.
+    dependson can be None, a taskkey in tasks or a taskkey from an earlier call of runsubmoduletasks.
+    If the task dependson failed (i.e. it is in failedtaskkeys) then the task is skipped and also counted as failed (so tasks depending on it are skipped) but it is not added to failures since the original failure is already there.
+
+    If workers is None, run the tasks one at a time in order.
+    Otherwise run up to workers tasks at the same time in threads. This works since most of the time is spent waiting for rsync/git subprocesses.
+    Tasks that don't depend on each other are started in the order they are given.
+
+    failedtaskkeys is a set that the keys of failed tasks are added to.
+    Return failures which is a list of [description, error] for every task that failed.
+    """
+    import concurrent.futures
+
+    if failedtaskkeys is None:
+        failedtaskkeys = set()
+    failures = []
+
+    def runtask(task):
+        event = tracebegin(task[0][0], 'task', module = getmodulename(task[0][1]), path = task[0][1])
+        try:
+            task[2]()
+        except Exception as e:
+            traceend(event, error = str(e))
+            return(e)
+        traceend(event)
+        return(None)
+
+    def recordfailure(task, error):
+        failedtaskkeys.add(task[0])
+        failures.append([task[3], str(error)])
+        print(task[3] + ' Error: ' + str(error))
+
+    if workers is None or workers <= 1:
+        for task in tasks:
+            if task[1] is not None and task[1] in failedtaskkeys:
+                failedtaskkeys.add(task[0])
+                continue
+            error = runtask(task)
+            if error is not None:
+                recordfailure(task, error)
+        return(failures)
+
+    # children[taskkey] are the tasks that need to wait for taskkey
+    taskkeys = set(task[0] for task in tasks)
+    children = {}
+    readytasks = []
+    for task in tasks:
+        if task[1] is not None and task[1] in taskkeys:
+            if task[1] not in children:
+                children[task[1]] = []
+            children[task[1]].append(task)
+        else:
+            readytasks.append(task)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+        running = {}
+
+        def submittask(task):
+            if task[1] is not None and task[1] in failedtaskkeys:
+                failedtaskkeys.add(task[0])
+                # so tasks depending on this task are also skipped
+                for childtask in children.pop(task[0], []):
+                    submittask(childtask)
+            else:
+                running[executor.submit(runtask, task)] = task
+
+        for task in readytasks:
+            submittask(task)
+
+        while len(running) > 0:
+            done, notdone = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                error = future.result()
+                if error is not None:
+                    recordfailure(task, error)
+                for childtask in children.pop(task[0], []):
+                    submittask(childtask)
+
+    return(failures)
+
+
+# Add Local Submodules:{{{1
+def getsubmodulepathdicts(modulepathstodolist, submodulepathdict, submodules1dict, submodules2dict, submodulename1 = 'submodules', submodulename2 = 'submodules2', modulescansearchlist = None, cyclemode = 'skip', maxnestingdepth = None):
+    """
+    Get list of every saved location of modules which I need to adjust submodules for with the submodules I need.
+
+    cyclemode and maxnestingdepth are as in dosubmodules. Cycles are found from submodules1dict before anything else (see getsubmodulecycles).
+    """
+    cycles = getsubmodulecycles(submodules1dict)
+    if len(cycles) > 0:
+        if cyclemode == 'error':
+            raise ValueError('Submodule cycles found: ' + getcyclesstring(cycles) + '.')
+        print('Submodule cycles found so skipping the submodule that completes each cycle: ' + getcyclesstring(cycles) + '.')
+
+    # want to get two objects:
+    # submodulepathsubmodulesdict - each place where I physically have a module/submodules and the submodules that it calls
+    submodulepathsubmodulesdict = {}
+
+    # add submodules2 for each moduletodo:
+    for modulepathtodo in modulepathstodolist:
+        submodulepathsubmodulesdict[os.path.join(modulepathtodo, submodulename2) + '/'] = set()
+
+    # to do this go through list of modules and add to these submodulesfull dicts
+    # elements of toparselist: path, submodulename2root, names of the project and modules path is nested in (ending with the module itself)
+    toparselist = [[os.path.join(modulepathtodo, ''), os.path.join(modulepathtodo, submodulename2) + '/', [getmodulename(modulepathtodo)]] for modulepathtodo in modulepathstodolist]
+    while len(toparselist) > 0:
+        modulepath, submodule2rootpath, ancestors = toparselist.pop(0)
+
+        modulename = modulepath.split('/')[-2]
+
+        # add submodules1_adjusted elements
+        submodules1_adjusted = []
+        for submodule1 in submodules1dict[modulename]:
+            # remove if circular
+            if submodule1 in ancestors:
+                continue
+            if maxnestingdepth is not None and len(ancestors) > maxnestingdepth:
+                continue
+            submodules1_adjusted.append(submodule1)
+        submodulepathsubmodulesdict[os.path.join(modulepath, submodulename1) + '/'] = submodules1_adjusted
+
+        # only parse submodules2 that are new to this project since they all go in the same folder
+        newsubmodules2 = [submodule for submodule in submodules2dict[modulename] if submodule not in submodulepathsubmodulesdict[submodule2rootpath]]
+
+        # add submodules2 elements to existing set
+        submodulepathsubmodulesdict[submodule2rootpath].update(submodules2dict[modulename])
+
+        # add every submodule1 and submodule2 to parselist
+        for submodule in submodules1_adjusted:
+            if modulescansearchlist is None or submodule in modulescansearchlist:
+                toparselist.append([os.path.join(modulepath, submodulename1, submodule) + '/', submodule2rootpath, ancestors + [submodule]])
+        for submodule in newsubmodules2:
+            if modulescansearchlist is None or submodule in modulescansearchlist:
+                toparselist.append([os.path.join(submodule2rootpath, submodule) + '/', submodule2rootpath, [ancestors[0], submodule]])
+
+    return(submodulepathsubmodulesdict)
+        
+
+def preparelocalsubmodulesfolder(thispath, submodules, trashdir = None):
+    """
+    Get the submodules folder thispath ready for submodules: delete it if there are no submodules, otherwise create it and delete any superfluous items in it.
+    trashdir is as in rmrecursive.
+    """
+    if len(submodules) == 0:
+        # delete if no submodules
+        if os.path.lexists(thispath):
+            rmrecursive(thispath, trashdir = trashdir)
+    else:
+        if os.path.isdir(thispath):
+            # ensure can write in this folder - needed when have readonly = True
+            os.chmod(thispath, 0o770)
+
+            # delete any superfluous items in the submodules folder
+            for folder in os.listdir(thispath):
+                if folder not in submodules:
+                    rmrecursive(os.path.join(thispath, folder), trashdir = trashdir)
+        else:
+            # ensure that I can write the submodules/ folder - needed when have readonly = True
+            os.chmod(os.path.dirname(thispath[: -1]), 0o770)
+            # add if submodules folder does not exist
+            os.mkdir(thispath)
+
+
+def copysubmodule(sourcepath, submodulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', rsync_gitskip = True, deleteexcluded = False, gitclonelocal = False, usestamps = False, revisiondict = None, storepath = None, linkmode = 'auto', storeindex = None, readonly = False, syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, mirrordict = None):
+    """
+    Copy or clone the module at sourcepath to submodulepath. This is used by both addlocalsubmodule and addsubmodules_local.
+
+    If usestamps is True, skip the copy if the stamp of the source revision (see getsubmodulestamp) already in the copy is the same. Otherwise copy and write the stamp with a snapshot of the copy (see getsubmodulesnapshot) so getsubmodulesstatus can also check it.
+    If usestamps is False, no stamp is written so I don't need to get the revision of the source and any old stamp is deleted.
+    If gitclonelocal is True, git clone sourcepath (see gitclonesubmodule with mirrorcachedir, mirrorrefresh, clonemode, clonedepth, clonefilter and mirrordict).
+    Otherwise if storepath is given, copy through the content-addressed store at storepath (see addsubmodule_store).
+    Otherwise copy with syncbackend (see syncsubmodule). deleteexcluded is as in syncsubmodule.
+    readonly makes the copy read only.
+    trashdir is as in rmrecursive.
+
+    Return the stamp (None if usestamps is False or sourcepath is not a git repository).
+    """
+    if usestamps is False:
+        stamp = None
+    elif gitclonelocal is True:
+        if mirrorcachedir is not None:
+            stamp = getsubmodulestamp(sourcepath, 'gitclone', {'readonly': readonly, 'clonemode': clonemode, 'clonedepth': clonedepth}, revisiondict = revisiondict)
+        else:
+            stamp = getsubmodulestamp(sourcepath, 'gitclone', {'readonly': readonly}, revisiondict = revisiondict)
+    elif storepath is not None:
+        stamp = getsubmodulestamp(sourcepath, 'store', {'submodulename1': submodulename1, 'submodulename2': submodulename2, 'rsync_gitskip': rsync_gitskip, 'readonly': readonly, 'storepath': os.path.realpath(storepath), 'linkmode': linkmode}, revisiondict = revisiondict, ignorenames = [submodulename1, submodulename2])
+    else:
+        stamp = getsubmodulestamp(sourcepath, 'rsync', {'submodulename1': submodulename1, 'submodulename2': submodulename2, 'rsync_gitskip': rsync_gitskip, 'readonly': readonly}, revisiondict = revisiondict, ignorenames = [submodulename1, submodulename2])
+    if stamp is not None and readsubmodulestamp(submodulepath) == stamp:
+        tracecount('submodulesskipped', 1)
+        return(stamp)
+
+    # submodulepath may be a link to another copy from collapsenested in dosubmodules
+    if os.path.islink(submodulepath):
+        os.remove(submodulepath)
+
+    if gitclonelocal is True:
+        # delete everything
+        if os.path.lexists(submodulepath):
+            rmrecursive(submodulepath, trashdir = trashdir)
+
+        gitclonesubmodule(sourcepath, submodulepath, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+    elif storepath is not None:
+        if usestamps is True:
+            protectpatterns = ['/' + stampfilename_default]
+        else:
+            protectpatterns = None
+        # same as --delete-excluded with rsync in syncsubmodule
+        addsubmodule_store(sourcepath, submodulepath, storepath, getsubmoduleexcludepatterns(submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip), deleteexcluded = deleteexcluded and rsync_gitskip, readonly = readonly, linkmode = linkmode, storeindex = storeindex, protectpatterns = protectpatterns)
+    else:
+        syncsubmodule(sourcepath, submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip, deleteexcluded = deleteexcluded, usestamps = usestamps, syncbackend = syncbackend, readonly = readonly)
+
+    if stamp is not None:
+        writesubmodulestamp(submodulepath, stamp, snapshot = getsubmodulesnapshot(submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2))
+        if gitclonelocal is True:
+            excludestampfile(submodulepath)
+
+    # make submodule read only so I don't rewrite it
+    # the store and syncsubmodule already make everything read only
+    if readonly is True and gitclonelocal is True:
+        chmodrecursive(submodulepath, 0o555)
+
+    return(stamp)
+
+
+def clonesubmodulefromurl(url, submodulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', readonly = False, usestamps = False, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, mirrordict = None):
+    """
+    git clone url to submodulepath for a submodule I don't have a local copy of. This is used by both addlocalsubmodule and addsubmodules_local.
+    I can't tell whether the repository has changed so always clone again.
+
+    If usestamps is True, a stamp with the HEAD of the clone and a snapshot of the clone is written so getsubmodulesstatus can check the clone has not been modified.
+    readonly makes the clone read only. trashdir is as in rmrecursive. The other arguments are as in gitclonesubmodule.
+    """
+    if os.path.lexists(submodulepath):
+        rmrecursive(submodulepath, trashdir = trashdir)
+    gitclonesubmodule(url, submodulepath, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+
+    if usestamps is True:
+        revision = getmodulerevision(submodulepath, includedirty = False)
+    else:
+        revision = None
+    if revision is not None:
+        stamp = {'source': url, 'revision': revision, 'method': 'gitclone', 'options': {'readonly': readonly}}
+        writesubmodulestamp(submodulepath, stamp, snapshot = getsubmodulesnapshot(submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2))
+        excludestampfile(submodulepath)
+
+    if readonly is True:
+        chmodrecursive(submodulepath, 0o555)
+
+
+def addlocalsubmodule(submodulepath, submodule, submodulepathdict, gitclonedict, readonly = False, submodulename1 = 'submodules', submodulename2 = 'submodules2', rsync_gitskip = True, gitclonelocal = False, usestamps = False, revisiondict = None, storepath = None, linkmode = 'auto', storeindex = None, syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, mirrordict = None):
+    """
+    Copy or clone a single submodule to submodulepath for addlocalsubmodules.
+    Raise an error if the copy fails.
+
+    Submodules in submodulepathdict are copied with copysubmodule which explains the other arguments. Excluded files are deleted from the copy.
+    mirrorcachedir, mirrorrefresh, clonemode, clonedepth, clonefilter and mirrordict are also used to git clone submodules in gitclonedict.
+    """
+    if submodule in submodulepathdict:
+        copysubmodule(submodulepathdict[submodule], submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip, deleteexcluded = True, gitclonelocal = gitclonelocal, usestamps = usestamps, revisiondict = revisiondict, storepath = storepath, linkmode = linkmode, storeindex = storeindex, readonly = readonly, syncbackend = syncbackend, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+    elif submodule in gitclonedict:
+        # use git clone to copy submodule
+        clonesubmodulefromurl(gitclonedict[submodule], submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, readonly = readonly, usestamps = usestamps, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+
+    else:
+        raise ValueError('Submodule path does not have a place to be copied/linked from: ' + submodulepath + '.')
+
+
+def addlocalsubmodules(submodulepathsubmodulesdict, submodulepathdict, readonly = False, gitclonedict = None, submodulename1 = 'submodules', submodulename2 = 'submodules2', rsync_gitskip = True, gitclonelocal = False, workers = None, usestamps = False, storepath = None, linkmode = 'auto', syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None):
+    """
+    gitclonedict allows possibility of cloning from an external repository i.e. github
+    gitclonedict[submodulename] should be the repository to be cloned from
+
+    gitclonelocal means that I use git clone to copy over modeuls rather than rsync - slower but avoid copying git ignored files
+
+    workers allows up to workers submodules to be copied/cloned at the same time (see runsubmoduletasks). A submodules folder is only changed once the submodule containing it has been copied.
+    Failures don't stop other submodules being added. Return a list of [description, error] for each failure.
+
+    usestamps means I skip copying submodules whose source has not changed since they were last copied (see addlocalsubmodule).
+
+    storepath means I copy submodules through a content-addressed store at storepath rather than with rsync (see addsubmodule_store). With readonly = True, copies are hard links to the store so identical files across submodules folders only use disk space once.
+
+    syncbackend is 'rsync' or 'native' (see syncsubmodule). 'native' avoids starting an rsync process for every submodule.
+
+    trashdir means folders I delete are moved into trashdir and deleted in the background rather than deleted straight away (see rmrecursive). trashdir should be on the same filesystem as the submodules.
+
+    mirrorcachedir means git clones are done from bare mirrors kept in mirrorcachedir so cloning the same module again only costs fetching the changes (see gitclonesubmodule). Mirrors are only fetched if mirrorrefresh is True. clonemode, clonedepth and clonefilter are as in gitclonesubmodule.
+    """
+    if gitclonedict is None:
+        gitclonedict = {}
+
+    # so I only get the revision of each source once
+    revisiondict = {}
+    # so I only create/fetch each mirror once
+    mirrordict = {}
+
+    if storepath is not None:
+        storeindex = loadstoreindex(storepath)
+    else:
+        storeindex = None
+
+    # tasks to prepare each submodules folder and to add each submodule
+    tasks = []
+    addtaskkeys = set()
+    for thispath in submodulepathsubmodulesdict:
+        for submodule in submodulepathsubmodulesdict[thispath]:
+            addtaskkeys.add(('add', os.path.join(thispath, submodule) + '/'))
+
+    for thispath in submodulepathsubmodulesdict:
+        submodules = submodulepathsubmodulesdict[thispath]
+
+        # the submodules folder is in a submodule I may be copying in which case I need to wait for this copy
+        parenttaskkey = ('add', os.path.dirname(thispath[: -1]) + '/')
+        if parenttaskkey not in addtaskkeys:
+            parenttaskkey = None
+        tasks.append([('prepare', thispath), parenttaskkey, functools.partial(preparelocalsubmodulesfolder, thispath, submodules, trashdir = trashdir), 'Preparing submodules folder failed: ' + thispath + '.'])
+
+        for submodule in submodules:
+            submodulepath = os.path.join(thispath, submodule)
+            func = functools.partial(addlocalsubmodule, submodulepath, submodule, submodulepathdict, gitclonedict, readonly = readonly, submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip, gitclonelocal = gitclonelocal, usestamps = usestamps, revisiondict = revisiondict, storepath = storepath, linkmode = linkmode, storeindex = storeindex, syncbackend = syncbackend, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+            tasks.append([('add', submodulepath + '/'), ('prepare', thispath), func, 'Adding module failed: Submodulepath: ' + submodulepath + '.'])
+
+    failures = runsubmoduletasks(tasks, workers = workers)
+
+    if storepath is not None:
+        savestoreindex(storepath, storeindex)
+
+    return(failures)
+
+
+def addlocalsubmodules_full(modulepathstodolist, submodulepathdict, submodulename1 = 'submodules', submodulename2 = 'submodules2', submodulescharacters = submodulecharacters_default, filestoparsedict = None, submoduleslistcheck = None, modulescansearchlist = None, symlinkdict = None, readonly = False, gitclonedict = None, scancachefile = None, workers = None, usestamps = False, storepath = None, linkmode = 'auto', syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, cyclemode = 'skip', maxnestingdepth = None, staged = False):
+    """
+    Implement submodules using local submodules folders.
+    Works with/without symlinks.
+
+    scancachefile is an optional file where I save the results of parsing files so I only need to parse changed files next time.
+    workers is the number of submodules to copy at the same time (see addlocalsubmodules).
+    usestamps means I skip copying submodules whose source has not changed since they were last copied (see addlocalsubmodules).
+    storepath and linkmode allow submodules to be copied through a content-addressed store (see addlocalsubmodules).
+    syncbackend is 'rsync' or 'native' (see syncsubmodule).
+    trashdir is where folders are moved to be deleted in the background (see addlocalsubmodules).
+    mirrorcachedir, mirrorrefresh, clonemode, clonedepth and clonefilter allow git clones to be done from a cache of bare mirrors (see addlocalsubmodules).
+    cyclemode and maxnestingdepth control how far submodules are nested (see getsubmodulepathdicts).
+    staged means the submodules folders are built in a staging folder in each project and swapped in at the end (see swapstaging). They are only swapped in if nothing failed.
+
+    Return a list of [description, error] for any submodules that failed to be added.
+    """
+    import copy
+
+    if scancachefile is not None:
+        scancache = loadscancache(scancachefile, submodulecharacters = submodulecharacters_default)
+    else:
+        scancache = None
+
+    # get all potential submodules
+    # input copy of modulepathstodolist so don't adjust modulepathstodolist here
+    submodules1dict, submodules2dict = getsubmodulesall(copy.deepcopy(modulepathstodolist), submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, submodulecharacters = submodulecharacters_default, filestoparsedict = filestoparsedict, submoduleslistcheck = submoduleslistcheck, modulescansearchlist = modulescansearchlist, scancache = scancache)
+    if scancachefile is not None:
+        savescancache(scancache, scancachefile)
+
+    # get the submodule path dicts to run
+    submodulepathsubmodulesdict = getsubmodulepathdicts(modulepathstodolist, submodulepathdict, submodules1dict, submodules2dict, submodulename1 = submodulename1, submodulename2 = submodulename2, modulescansearchlist = modulescansearchlist, cyclemode = cyclemode, maxnestingdepth = maxnestingdepth)
+
+    # build the submodules folders in the staging folder of each project instead
+    if staged is True:
+        submodulepathsubmodulesdict2 = {}
+        for modulepath in modulepathstodolist:
+            modulepath = os.path.join(modulepath, '')
+            stagingpath = preparestaging(modulepath, submodulename1 = submodulename1, submodulename2 = submodulename2)
+            for thispath in submodulepathsubmodulesdict:
+                if thispath.startswith(modulepath):
+                    submodulepathsubmodulesdict2[stagingpath + thispath[len(modulepath): ]] = submodulepathsubmodulesdict[thispath]
+        submodulepathsubmodulesdict = submodulepathsubmodulesdict2
+
+    # actually implement the submodules locally
+    traceevent = tracebegin('addsubmodules', 'phase')
+    failures = addlocalsubmodules(submodulepathsubmodulesdict, submodulepathdict, readonly = readonly, submodulename1 = submodulename1, submodulename2 = submodulename2, gitclonedict = gitclonedict, workers = workers, usestamps = usestamps, storepath = storepath, linkmode = linkmode, syncbackend = syncbackend, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter)
+    traceend(traceevent)
+
+    if staged is True:
+        if len(failures) > 0:
+            print('Submodules not swapped in since some failed. Run again to carry on from the staging folders.')
+        else:
+            for modulepath in modulepathstodolist:
+                swapstaging(modulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, trashdir = trashdir)
+
+    return(failures)
+
+
+# Overall Function:{{{1
+def getmodulename(modulepath):
+    if modulepath[-1] == '/':
+        modulename = os.path.basename(modulepath[: -1])
+    else:
+        modulename = os.path.basename(modulepath)
+    return(modulename)
+
+
+def resolvemodulenode(graph, modulename, scanpath, findsubmodulefunc, nodesource = True):
+    """
+    Get [submodules1, submodules2] for modulename from graph, only calling findsubmodulefunc(scanpath) the first time I see the module.
+
+    graph[nodekey] = [submodules1, submodules2]
+    nodekey is (modulename, real path of scanpath) if nodesource is True.
+    If nodesource is False then scanpath is a copy of the module so nodekey is (modulename, None) - every copy of a module comes from the same place so only needs to be parsed once.
+
+    Return nodekey.
+    """
+    if nodesource is True:
+        nodekey = (modulename, os.path.realpath(scanpath))
+    else:
+        nodekey = (modulename, None)
+
+    if nodekey not in graph:
+        with tracephase('getsubmodules', 'scan', module = modulename, path = scanpath):
+            submodules1, submodules2 = findsubmodulefunc(scanpath)
+        graph[nodekey] = [list(submodules1), list(submodules2)]
+
+    return(nodekey)
+
+
+def getdependencygraph(modulepathstodolist, findsubmodulefunc, submodulesourcefunc, modulescansearchlist = None, graph = None, printdetails = False):
+    """
+    Build the dependency graph for modulepathstodolist before anything is copied.
+
+    submodulesourcefunc(submodule) returns the path of the original version of submodule (or None if I don't know where it is).
+    Submodules are parsed at this original version rather than at each copy so each distinct module is only parsed once however many times it appears in the nested submodules folders.
+    Submodules where submodulesourcefunc returns None are left to be parsed at their copy when they are added.
+
+    Return graph where graph[nodekey] = [submodules1, submodules2] (see resolvemodulenode).
+    graph can be given to reuse the results from a previous call.
+    """
+    if graph is None:
+        graph = {}
+
+    # list of nodekeys to go through the submodules of
+    tocheck = []
+    for modulepath in modulepathstodolist:
+        tocheck.append(resolvemodulenode(graph, getmodulename(modulepath), modulepath, findsubmodulefunc))
+
+    checked = set()
+    while len(tocheck) > 0:
+        nodekey = tocheck.pop(0)
+        if nodekey in checked:
+            continue
+        checked.add(nodekey)
+
+        for submodule in graph[nodekey][0] + graph[nodekey][1]:
+            if modulescansearchlist is not None and submodule not in modulescansearchlist:
+                continue
+            sourcepath = submodulesourcefunc(submodule)
+            if sourcepath is None or not os.path.isdir(sourcepath):
+                continue
+            if printdetails is True and (submodule, os.path.realpath(sourcepath)) not in graph:
+                print(str(datetime.datetime.now()) + ': Parsing module: ' + submodule + '.')
+            tocheck.append(resolvemodulenode(graph, submodule, sourcepath, findsubmodulefunc))
+
+    return(graph)
+
+
+def getsubmodulecycles(submodules1dict):
+    """
+    Find the cycles in the submodules1 dependencies i.e. a has submodules/b/ and b has submodules/a/. These would nest forever.
+    submodules1dict[modulename] is the list of submodules1 of modulename.
+
+    Use Tarjan's algorithm to get the strongly connected components and return a cycle for each component that has one.
+    Each cycle is a list of module names where each has the next one as a submodule1 and the last has the first (so a module that is a submodule of itself gives [a]).
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    onstack = set()
+    components = []
+    counter = 0
+
+    for startnode in sorted(submodules1dict):
+        if startnode in index:
+            continue
+        # each element is [node, iterator over its submodules]
+        callstack = [[startnode, iter(submodules1dict.get(startnode, []))]]
+        index[startnode] = counter
+        lowlink[startnode] = counter
+        counter = counter + 1
+        stack.append(startnode)
+        onstack.add(startnode)
+        while len(callstack) > 0:
+            node, children = callstack[-1]
+            child = next(children, None)
+            if child is not None:
+                if child not in index:
+                    index[child] = counter
+                    lowlink[child] = counter
+                    counter = counter + 1
+                    stack.append(child)
+                    onstack.add(child)
+                    callstack.append([child, iter(submodules1dict.get(child, []))])
+                elif child in onstack:
+                    lowlink[node] = min(lowlink[node], index[child])
+                continue
+
+            callstack.pop()
+            if len(callstack) > 0:
+                parent = callstack[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onstack.remove(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    cycles = []
+    for component in components:
+        componentset = set(component)
+        first = min(component)
+        # shortest path from first back to itself in the component
+        previous = {}
+        tosearch = [first]
+        found = False
+        while len(tosearch) > 0 and found is False:
+            thisnode = tosearch.pop(0)
+            for child in submodules1dict.get(thisnode, []):
+                if child == first:
+                    found = True
+                    last = thisnode
+                    break
+                if child in componentset and child not in previous:
+                    previous[child] = thisnode
+                    tosearch.append(child)
+        if found is False:
+            continue
+        cycle = [last]
+        while cycle[0] != first:
+            cycle.insert(0, previous[cycle[0]])
+        cycles.append(cycle)
+
+    return(cycles)
+
+
+def getcyclesstring(cycles):
+    return('; '.join(' -> '.join(cycle + [cycle[0]]) for cycle in cycles))
+
+
+def preparesubmodulesfolders(modulepath, overallmodulepath, submodules1, submodules2donow, submodulename1 = 'submodules', submodulename2 = 'submodules2', trashdir = None):
+    """
+    For dosubmodules: mkdir submodules folders for modulepath and remove unneeded submodules1.
+    trashdir is as in rmrecursive.
+    """
+    # ensure can write in the module and its submodules folder - needed when submodules are read only
+    for thispath in [modulepath, os.path.join(modulepath, submodulename1)]:
+        if os.path.isdir(thispath) and not os.path.islink(thispath) and not os.access(thispath, os.W_OK):
+            os.chmod(thispath, 0o755)
+
+    # only do for submodules1 since might get submodules2 later
+    thispath = os.path.join(modulepath, submodulename1)
+    if len(submodules1) == 0:
+        if os.path.exists(thispath):
+            rmrecursive(thispath, trashdir = trashdir)
+    else:
+        # mkdir submodules/ path for submodules1
+        if not os.path.isdir(thispath):
+            if os.path.exists(thispath):
+                rmrecursive(thispath, trashdir = trashdir)
+            os.mkdir(thispath)
+
+        # delete submodules/submodulename if shouldn't be there in submodules1
+        # do submodules2 later since other code might want this submodule
+        for folder in os.listdir(thispath):
+            if folder not in submodules1:
+                rmrecursive(os.path.join(thispath, folder), trashdir = trashdir)
+
+    # now mkdir for submodules2 if necessary
+    # exist_ok since other modules in the same project may be doing this at the same time
+    thispath = os.path.join(overallmodulepath, submodulename2)
+    if len(submodules2donow) > 0:
+        os.makedirs(thispath, exist_ok = True)
+
+
+def linksubmodule(submodulepath, linkto, trashdir = None):
+    """
+    Make submodulepath a symlink to linkto (for collapsenested in dosubmodules).
+    """
+    if os.path.islink(submodulepath) and os.readlink(submodulepath) == linkto:
+        return(None)
+    if os.path.lexists(submodulepath):
+        rmrecursive(submodulepath, trashdir = trashdir)
+    os.symlink(linkto, submodulepath)
+
+
+def dosubmodules(modulepathstodolist, findsubmodulefunc, addsubmodulefunc, submodulename1 = 'submodules', submodulename2 = 'submodules2', modulescansearchlist = None, printdetails = False, submodulesourcefunc = None, workers = None, trashdir = None, cyclemode = 'skip', maxnestingdepth = None, collapsenested = False, staged = False, expecteddict = None):
+    """
+
+    This is designed to be a relatively flexible function that does everything except determine which submodules need to be added and actually adding the submodules.
+
+    modulepathstodolist should be a list of modules to implement submodules for
+
+    findsubmodulefunc(modulepath) returns [submodules1, submodules2] for the module at modulepath.
+    Each distinct module is only parsed once (see resolvemodulenode).
+    If submodulesourcefunc is given, the full dependency graph is built first by parsing the original version of each submodule (see getdependencygraph) and then the submodules are added from this graph.
+    Otherwise submodules are parsed at their copy after they are added.
+
+    Changes to the folders are run as tasks (see runsubmoduletasks). If workers is None, each task is run straight away.
+    Otherwise tasks are collected and run with up to workers at the same time. A submodule is only added once the module containing it has been added and its submodules folder prepared.
+    I only need to stop and run the collected tasks when I need to parse a copy of a module (i.e. when submodulesourcefunc doesn't give the original version).
+
+    trashdir means unneeded submodules are moved into trashdir and deleted in the background (see rmrecursive).
+
+    A submodule1 is never added inside a copy of itself (i.e. a/submodules/b/submodules/a) since this would nest forever. I check this with the chain of modules each copy is nested in.
+    If the dependency graph is built first, the cycles are found from the graph before anything is copied (see getsubmodulecycles) and printed.
+    cyclemode:
+    - 'skip': skip the submodule that would complete a cycle
+    - 'error': raise an error listing the cycles before anything is copied (or when a cycle is found if the graph is not built first)
+
+    maxnestingdepth stops submodules1 being added more than this many submodules folders below the project (submodules2 count as depth 1). None means no limit.
+    collapsenested means only the shallowest copy of each module in a project is a real copy and every deeper submodules1 copy of it is a relative symlink to this copy. Modules are done in breadth first order so the shallowest copy is found first.
+    With deep dependency chains this stops the number of copies multiplying at each level.
+
+    staged means the submodules folders of each project are built in a staging folder in the project (see preparestaging) and swapped in at the end (see swapstaging) rather than changed in place.
+    So the project only has incomplete submodules folders for the time it takes to do a rename. addsubmodulefunc is then called with the staging folder as the project.
+    If anything in a project fails, its submodules folders are not swapped in and the staging folder is kept so the next run carries on from it.
+
+    If expecteddict is given, nothing is added or changed. Instead expecteddict[modulepath][submodulepath] = submodule (with submodulepath ending in /) is filled in for every copy that would be added (see getexpectedsubmodules).
+    Copies that are parsed rather than their original version (i.e. git cloned from a url) are parsed where they are now and skipped if they aren't there.
+
+    Failures don't stop other submodules being added. Return a list of [description, error] for each failure.
+    """
+
+    for modulepath in modulepathstodolist:
+        if not os.path.isdir(modulepath):
+            raise ValueError('Modulepath does not exist: ' + modulepath + '.')
+    if cyclemode not in ['skip', 'error']:
+        raise ValueError('cyclemode not recognised: ' + str(cyclemode) + '.')
+
+    if printdetails is True:
+        print(str(datetime.datetime.now()) + ': Basic setup.')
+
+    # get submodules for every module I can before I add anything
+    if submodulesourcefunc is not None:
+        if printdetails is True:
+            print(str(datetime.datetime.now()) + ': Building dependency graph.')
+        with tracephase('dependencygraph', 'phase'):
+            graph = getdependencygraph(modulepathstodolist, findsubmodulefunc, submodulesourcefunc, modulescansearchlist = modulescansearchlist, printdetails = printdetails)
+
+        submodules1dict = {}
+        for nodekey in graph:
+            if nodekey[0] not in submodules1dict:
+                submodules1dict[nodekey[0]] = []
+            submodules1dict[nodekey[0]] = submodules1dict[nodekey[0]] + [submodule for submodule in graph[nodekey][0] if submodule not in submodules1dict[nodekey[0]]]
+        cycles = getsubmodulecycles(submodules1dict)
+        if len(cycles) > 0:
+            if cyclemode == 'error':
+                raise ValueError('Submodule cycles found: ' + getcyclesstring(cycles) + '.')
+            print('Submodule cycles found so skipping the submodule that completes each cycle: ' + getcyclesstring(cycles) + '.')
+    else:
+        graph = {}
+
+    # tasks I have not run yet
+    tasks = []
+    failedtaskkeys = set()
+    failures = []
+    def runtasks():
+        failures.extend(runsubmoduletasks(tasks, workers = workers, failedtaskkeys = failedtaskkeys))
+        tasks.clear()
+    def addtask(task):
+        if expecteddict is not None:
+            return(None)
+        tasks.append(task)
+        if workers is None:
+            runtasks()
+
+    if expecteddict is not None:
+        staged = False
+        for modulepath in modulepathstodolist:
+            expecteddict[modulepath] = {}
+
+    # where I build the submodules folders of each project
+    if staged is True:
+        overallmodulepaths = [preparestaging(modulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, printdetails = printdetails) for modulepath in modulepathstodolist]
+    else:
+        overallmodulepaths = modulepathstodolist
+
+    # list is [modulepath, overallmodulepath, scanpath, nodesource, ancestors] for each element to do
+    # scanpath is where I parse the module and nodesource is whether scanpath is the original version of the module (see resolvemodulenode)
+    # ancestors are the names of the project and the modules modulepath is nested in (ending with the module itself)
+    todolist = [[overallmodulepath, overallmodulepath, modulepath, True, [getmodulename(modulepath)]] for modulepath, overallmodulepath in zip(modulepathstodolist, overallmodulepaths)]
+
+    # firstcopies[overallmodulepath][modulename] is the shallowest copy of modulename in the project for collapsenested
+    firstcopies = {}
+    for overallmodulepath in overallmodulepaths:
+        firstcopies[overallmodulepath] = {}
+
+    # define submodules2dictoverall for each modulepath
+    # this allows me to keep track of which submodules2 appear overall in each project
+    submodules2dictoverall = {}
+    for overallmodulepath in overallmodulepaths:
+        submodules2dictoverall[overallmodulepath] = set()
+    
+    # now go through every module, find relevant submodules, mkdir submodules and delete unnecessary things, add submodules
+    traceevent = tracebegin('addsubmodules', 'phase')
+    while len(todolist) > 0:
+        modulepath, overallmodulepath, scanpath, nodesource, ancestors = todolist.pop(0)
+
+        modulename = getmodulename(modulepath)
+
+        # task that added this module (None for modules in modulepathstodolist)
+        if modulepath in overallmodulepaths:
+            addtaskkey = None
+        else:
+            addtaskkey = ('add', modulepath)
+
+        # if I need to parse the copy of the module then I need to run the tasks so the copy exists
+        if nodesource is False and (modulename, None) not in graph and len(tasks) > 0:
+            runtasks()
+        if addtaskkey is not None and addtaskkey in failedtaskkeys:
+            continue
+        if expecteddict is not None and not os.path.isdir(scanpath):
+            continue
+
+        if printdetails is True:
+            print('\n' + str(datetime.datetime.now()))
+            print('Modulepath: ' + modulepath + '.')
+            print('Modulename: ' + modulename + '.')
+
+        # find submodules to do:{{{
+        # get the submodules from the graph (only parsing the module if I haven't seen it before)
+        nodekey = resolvemodulenode(graph, modulename, scanpath, findsubmodulefunc, nodesource = nodesource)
+        submodules1, submodules2 = graph[nodekey]
+
+        # figure out which submodules2 are new
+        submodules2donow = []
+        for submodule2 in submodules2:
+            if submodule2 not in submodules2dictoverall[overallmodulepath]:
+                submodules2dictoverall[overallmodulepath].add(submodule2)
+                submodules2donow.append(submodule2)
+
+        if printdetails is True:
+            if len(submodules1) > 0:
+                print('Submodules1: ' + ', '.join(submodules1) + '.')
+            else:
+                print('No submodules1.')
+            if len(submodules2) > 0:
+                print('Submodules2: ' + ', '.join(submodules2) + '.')
+            else:
+                print('No submodules2.')
+
+        # a submodule can't be a submodule of itself and can't be deeper than maxnestingdepth
+        submodules1donow = []
+        for submodule1 in submodules1:
+            if submodule1 in ancestors:
+                if cyclemode == 'error':
+                    raise ValueError('Submodule cycle found: ' + ' -> '.join(ancestors[ancestors.index(submodule1): ] + [submodule1]) + '. Modulepath: ' + modulepath + '.')
+                if printdetails is True or len(graph) == 0:
+                    print('Submodule cannot be a submodule of itself: Modulepath: ' + modulepath + '. Submodule: ' + submodule1 + '.')
+                continue
+            if maxnestingdepth is not None and len(ancestors) > maxnestingdepth:
+                if printdetails is True:
+                    print('Submodule skipped since deeper than maxnestingdepth: Modulepath: ' + modulepath + '. Submodule: ' + submodule1 + '.')
+                continue
+            submodules1donow.append(submodule1)
+        # find submodules to do:}}}
+
+        # mkdir submodules and remove unneeded submodules
+        preparetaskkey = ('prepare', modulepath)
+        addtask([preparetaskkey, addtaskkey, functools.partial(preparesubmodulesfolders, modulepath, overallmodulepath, submodules1donow, submodules2donow, submodulename1 = submodulename1, submodulename2 = submodulename2, trashdir = trashdir), 'Preparing submodules folders failed: Modulepath: ' + modulepath + '.'])
+
+        # add submodules1:{{{
+        for submodule1 in submodules1donow:
+            submodulepath = os.path.join(modulepath, submodulename1, submodule1)
+
+            # link to the shallowest copy in the project rather than copying again
+            if collapsenested is True and submodule1 in firstcopies[overallmodulepath]:
+                linkto = os.path.relpath(firstcopies[overallmodulepath][submodule1], os.path.join(modulepath, submodulename1))
+                if expecteddict is not None:
+                    expecteddict[overallmodulepath][os.path.join(submodulepath, '')] = submodule1
+                addtask([('add', submodulepath), preparetaskkey, functools.partial(linksubmodule, submodulepath, linkto, trashdir = trashdir), 'Linking module failed: Modulepath: ' + modulepath + '. Modulename: ' + submodule1 + '.'])
+                continue
+            firstcopies[overallmodulepath][submodule1] = submodulepath
+
+            # add submodules
+            if expecteddict is not None:
+                expecteddict[overallmodulepath][os.path.join(submodulepath, '')] = submodule1
+            addtask([('add', submodulepath), preparetaskkey, functools.partial(addsubmodulefunc, modulepath, submodulename1, submodule1), 'Adding module failed: Modulepath: ' + modulepath + '. Modulename: ' + submodule1 + '.'])
+
+            if modulescansearchlist is None or submodule1 in modulescansearchlist:
+                todoelement = [submodulepath, overallmodulepath] + getsubmodulescanpath(submodule1, submodulepath, submodulesourcefunc) + [ancestors + [submodule1]]
+                if collapsenested is True:
+                    # breadth first so the shallowest copy of each module is the one that is kept
+                    todolist.append(todoelement)
+                else:
+                    # add to start of list to ensure I complete one module at a time
+                    todolist.insert(0, todoelement)
+        # add submodules1:}}}
+
+        # add submodules2:{{{
+        for submodule2 in submodules2donow:
+            # don't need to worry about submodule2 being a submodule of itself since this won't keep going recursively
+            submodulepath = os.path.join(overallmodulepath, submodulename2, submodule2)
+            if expecteddict is not None:
+                expecteddict[overallmodulepath][os.path.join(submodulepath, '')] = submodule2
+            addtask([('add', submodulepath), preparetaskkey, functools.partial(addsubmodulefunc, overallmodulepath, submodulename2, submodule2), 'Adding module failed: Submodulepath: ' + overallmodulepath + '. Modulename: ' + submodule2 + '.'])
+            if submodule2 not in firstcopies[overallmodulepath]:
+                firstcopies[overallmodulepath][submodule2] = submodulepath
+
+            if modulescansearchlist is None or submodule2 in modulescansearchlist:
+                # submodules2 are directly below the project
+                todoelement = [submodulepath, overallmodulepath] + getsubmodulescanpath(submodule2, submodulepath, submodulesourcefunc) + [[ancestors[0], submodule2]]
+                if collapsenested is True:
+                    todolist.append(todoelement)
+                else:
+                    todolist.insert(0, todoelement)
+        # add submodules2:}}}
+
+    runtasks()
+    traceend(traceevent)
+
+    if expecteddict is not None:
+        return(failures)
+
+    # after parsed all modules need to go through and delete remaining unneeded submodules2
+    # delete submodules2:{{{
+    # need to do afterwards because only get full list of submodules2 at end of parsing
+
+
+    for modulepath in submodules2dictoverall:
+        # delete overallmodulepath/submodules2 if empty
+        thispath = os.path.join(modulepath, submodulename2)
+        if len(submodules2dictoverall[modulepath]) == 0:
+            if os.path.exists(thispath):
+                rmrecursive(thispath, trashdir = trashdir)
+
+        elif os.path.isdir(thispath):
+                
+            # delete overallmodulepath/submodules2/redundantsubmodule
+            for folder in os.listdir(os.path.join(modulepath, submodulename2)):
+                if folder not in submodules2dictoverall[modulepath]:
+                    rmrecursive(os.path.join(modulepath, submodulename2, folder), trashdir = trashdir)
+
+    # delete submodules2:}}}
+
+    if staged is True:
+        for modulepath, overallmodulepath in zip(modulepathstodolist, overallmodulepaths):
+            if any(taskkey[1].startswith(overallmodulepath) for taskkey in failedtaskkeys):
+                print('Submodules not swapped in since some failed. Run again to carry on from the staging folder: Modulepath: ' + modulepath + '.')
+                continue
+            try:
+                swapstaging(modulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, trashdir = trashdir)
+            except Exception as e:
+                failures.append(['Swapping in staged submodules failed: Modulepath: ' + modulepath + '.', str(e)])
+                print('Swapping in staged submodules failed: Modulepath: ' + modulepath + '. Error: ' + str(e))
+
+    return(failures)
+
+
+def getsubmodulescanpath(submodule, submodulepath, submodulesourcefunc):
+    """
+    Get [scanpath, nodesource] for a submodule that has been added at submodulepath (see resolvemodulenode).
+    Parse the original version of the submodule if I know where it is and otherwise parse the copy.
+    """
+    if submodulesourcefunc is not None:
+        sourcepath = submodulesourcefunc(submodule)
+        if sourcepath is not None and os.path.isdir(sourcepath):
+            return([sourcepath, True])
+    return([submodulepath, False])
+
+    
+def getsubmodules_local(modulepath, submodulename1 = 'submodules', submodulename2 = 'submodules2', submodulecharacters = submodulecharacters_default, filestoparsedict = None, scancache = None, workers = None, workertype = 'thread', scanbackend = scanbackend_default, skipbinary = False, maxfilesize = None, includeglobs = None, excludeglobs = None, usemanifest = False, submodulesavailable = None, extrafilesdict = None):
+    """
+    Get [submodules1, submodules2] for modulepath by parsing the files in it.
+    If usemanifest is True, use the .mysubmodules file in modulepath where there is one and only parse the files if it has the parseforsubmodules option (see getsubmodules_manifest).
+    extrafilesdict[modulename] is an optional list of files to parse in modulename as well as the ones git lists (see getsubmodulesmulti).
+    """
+    if usemanifest is True:
+        findsubmodulefunc = functools.partial(getsubmodules_local, submodulename1 = submodulename1, submodulename2 = submodulename2, submodulecharacters = submodulecharacters, filestoparsedict = filestoparsedict, scancache = scancache, workers = workers, workertype = workertype, scanbackend = scanbackend, skipbinary = skipbinary, maxfilesize = maxfilesize, includeglobs = includeglobs, excludeglobs = excludeglobs, extrafilesdict = extrafilesdict)
+        return(getsubmodules_manifest(modulepath, findsubmodulefunc = findsubmodulefunc, submodulesavailable = submodulesavailable))
+
+    if modulepath[-1] == '/':
+        modulename = os.path.basename(modulepath[: -1])
+    else:
+        modulename = os.path.basename(modulepath)
+
+    filestoparse = None
+    if filestoparsedict is not None:
+        if modulename in filestoparsedict:
+            filestoparse = filestoparsedict[modulename]
+        else:
+            print('Modulename not in filestoparsedict: Modulename: ' + modulename + '.')
+
+    if extrafilesdict is not None:
+        extrafiles = extrafilesdict.get(modulename)
+    else:
+        extrafiles = None
+
+    # parse for both submodulename1 and submodulename2 in one pass through the files
+    submodulesdict = getsubmodulesmulti(modulepath, submoduleids = [submodulename1, submodulename2], submodulecharacters = submodulecharacters, filestoparse = filestoparse, submoduleslistcheck = None, scancache = scancache, workers = workers, workertype = workertype, scanbackend = scanbackend, skipbinary = skipbinary, maxfilesize = maxfilesize, includeglobs = includeglobs, excludeglobs = excludeglobs, extrafiles = extrafiles)
+    submodules1 = submodulesdict[submodulename1]
+    submodules2 = submodulesdict[submodulename2]
+
+    return(submodules1, submodules2)
+
+
+def getsubmodulesavailable(submodulepathdict, gitclonefunc = None):
+    """
+    Get submodulesavailable for getsubmodules_manifest: the submodules I can copy from submodulepathdict or git clone with gitclonefunc (see addsubmodules_local).
+    """
+    if gitclonefunc is None:
+        return(submodulepathdict)
+    return(lambda submodule: submodule in submodulepathdict or gitclonefunc(submodule) is not None)
+
+
+def addsubmodules_local(submodulepathdict, overallmodulepath, submodulename, submodule, submodulename1 = 'submodules', submodulename2 = 'submodules2', gitclonelocal = False, rsync_gitskip = True, usestamps = False, revisiondict = None, storepath = None, linkmode = 'auto', storeindex = None, readonly = False, syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, mirrordict = None, lockentries = None, gitclonefunc = None):
+    """
+    Submodules in submodulepathdict are copied with copysubmodule which explains the other arguments.
+    revisiondict is an optional dict so I only get the revision of each source once during a run.
+
+    lockentries is an optional dict where I save [submodule, sourcepath, revision] for each submodulepath for the lockfile (see getlockfile). It needs usestamps to be True.
+    gitclonefunc(submodule) is an optional function giving a url to git clone submodule from if it isn't in submodulepathdict (i.e. gitclonedict.get). It should return None if there isn't one.
+    """
+
+    submodulepath = os.path.join(overallmodulepath, submodulename, submodule)
+    if submodule not in submodulepathdict:
+        if gitclonefunc is not None:
+            url = gitclonefunc(submodule)
+        else:
+            url = None
+        if url is None:
+            raise ValueError('Submodule does not have a place to be copied/cloned from: ' + submodule + '.')
+
+        clonesubmodulefromurl(url, submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, readonly = readonly, usestamps = usestamps, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+        if lockentries is not None:
+            lockentries[submodulepath] = [submodule, url, None]
+        return(None)
+
+    stamp = copysubmodule(submodulepathdict[submodule], submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = rsync_gitskip, gitclonelocal = gitclonelocal, usestamps = usestamps, revisiondict = revisiondict, storepath = storepath, linkmode = linkmode, storeindex = storeindex, readonly = readonly, syncbackend = syncbackend, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict)
+    if lockentries is not None and usestamps is True:
+        if stamp is not None:
+            lockentries[submodulepath] = [submodule, submodulepathdict[submodule], stamp['revision']]
+        else:
+            lockentries[submodulepath] = [submodule, submodulepathdict[submodule], None]
+
+
+def dosubmodules_local(modulepathstodolist, submodulepathdict, filestoparsedict = None, gitclonelocal = False, rsync_gitskip = True, submodulename1 = 'submodules', submodulename2 = 'submodules2', modulescansearchlist = None, printdetails = False, scancachefile = None, scanworkers = None, scanworkertype = 'thread', scanbackend = scanbackend_default, skipbinary = False, maxfilesize = None, includeglobs = None, excludeglobs = None, workers = None, usestamps = False, storepath = None, linkmode = 'auto', readonly = False, syncbackend = syncbackend_default, trashdir = None, mirrorcachedir = None, mirrorrefresh = False, clonemode = 'reference', clonedepth = None, clonefilter = None, usemanifest = False, uselockfile = False, gitclonefunc = None, cyclemode = 'skip', maxnestingdepth = None, collapsenested = False, staged = False, scancache = None, extrafilesdict = None, expecteddict = None):
+    """
+    usemanifest means I get the submodules of a module from its .mysubmodules file where there is one rather than parsing all its files (see getsubmodules_manifest). Submodules with the no_error_not_found option are only skipped if they are neither in submodulepathdict nor can be cloned with gitclonefunc.
+    scancachefile is an optional file where I save the results of parsing files so repeat runs only parse files that have changed.
+    scancache is an optional scan cache already loaded by loadscancache which is used rather than loading scancachefile so it can be kept in memory between runs (see watchsubmodules_local). It is still saved to scancachefile if that is given.
+    extrafilesdict gives files to parse as well as the ones git lists (see getsubmodules_local).
+    scanworkers and scanworkertype allow files to be parsed by a pool of workers (see scanfilesforsubmodules).
+    scanbackend is 'python' or 'gitgrep' (see getsubmodulesmulti).
+    skipbinary, maxfilesize, includeglobs and excludeglobs allow files to be skipped when parsing (see getsubmodulesmulti).
+    workers is the number of submodules to rsync/clone at the same time (see dosubmodules).
+    usestamps means I skip copying submodules whose source has not changed since they were last copied (see addsubmodules_local).
+    storepath means I copy submodules through a content-addressed store at storepath rather than with rsync (see addsubmodule_store). With readonly = True, copies are hard links to the store so identical files only use disk space once.
+    readonly makes the submodules read only.
+    syncbackend is 'rsync' or 'native' (see syncsubmodule). 'native' avoids starting an rsync process for every submodule and works where rsync isn't installed.
+    trashdir means folders I delete are moved into trashdir and deleted in the background so I don't wait for large read only copies to be deleted (see rmrecursive). trashdir should be on the same filesystem as the submodules. I wait for the deletions to finish at the end of the run and any that failed are added to the failures.
+    mirrorcachedir means that with gitclonelocal = True, clones are done from bare mirrors kept in mirrorcachedir so cloning the same module again only costs fetching the changes (see gitclonesubmodule). Mirrors are only fetched if mirrorrefresh is True. clonemode, clonedepth and clonefilter are as in gitclonesubmodule.
+
+    uselockfile means I write a lockfile to each project in modulepathstodolist recording the submodules added and the revisions of their sources (see getlockfile).
+    On later runs, projects where the lockfile still matches are skipped altogether without parsing or copying anything (see checklockfile).
+    uselockfile also turns on usestamps so only the submodules that have changed are copied in projects that aren't skipped.
+
+    gitclonefunc(submodule) gives a url to git clone submodules that aren't in submodulepathdict from (see addsubmodules_local). These are parsed after they are cloned. Projects containing them never match their lockfile since I can't tell if they've changed.
+
+    cyclemode, maxnestingdepth and collapsenested control how far submodules are nested (see dosubmodules).
+
+    staged means the submodules folders are built in a staging folder and swapped in at the end (see dosubmodules).
+
+    If expecteddict is given, nothing is changed and expecteddict is filled in with the copies that would be added (see dosubmodules). Lockfiles are then neither read nor written and scancachefile is read but not saved.
+
+    Return a list of [description, error] for any submodules that failed to be added.
+    """
+    # so I only get the revision of each source once
+    revisiondict = {}
+
+    if expecteddict is not None:
+        uselockfile = False
+        if scancache is None and scancachefile is not None:
+            scancache = loadscancache(scancachefile)
+        scancachefile = None
+        storepath = None
+
+    if uselockfile is True:
+        usestamps = True
+        lockentries = {}
+        # everything that changes which submodules are added or how
+        lockoptions = {'submodulename1': submodulename1, 'submodulename2': submodulename2, 'gitclonelocal': gitclonelocal, 'rsync_gitskip': rsync_gitskip, 'modulescansearchlist': modulescansearchlist, 'filestoparsedict': filestoparsedict, 'skipbinary': skipbinary, 'maxfilesize': maxfilesize, 'includeglobs': includeglobs, 'excludeglobs': excludeglobs, 'usemanifest': usemanifest, 'storepath': storepath, 'linkmode': linkmode, 'readonly': readonly, 'clonemode': clonemode, 'clonedepth': clonedepth, 'maxnestingdepth': maxnestingdepth, 'collapsenested': collapsenested}
+        if storepath is not None:
+            lockoptions['storepath'] = os.path.realpath(storepath)
+
+        traceevent = tracebegin('checklockfiles', 'phase')
+        modulepathstodolist2 = []
+        for modulepath in modulepathstodolist:
+            if checklockfile(modulepath, lockoptions, submodulepathdict, includedirty = not gitclonelocal, revisiondict = revisiondict, submodulename1 = submodulename1, submodulename2 = submodulename2) is True:
+                if printdetails is True:
+                    print(str(datetime.datetime.now()) + ': Lockfile matches so skipping: ' + modulepath + '.')
+            else:
+                # delete the old lockfile so it can't match if this run fails
+                if os.path.isfile(os.path.join(modulepath, lockfilename_default)):
+                    os.remove(os.path.join(modulepath, lockfilename_default))
+                modulepathstodolist2.append(modulepath)
+        traceend(traceevent, skipped = len(modulepathstodolist) - len(modulepathstodolist2))
+        modulepathstodolist = modulepathstodolist2
+        if len(modulepathstodolist) == 0:
+            return([])
+    else:
+        lockentries = None
+
+    if scancache is None and scancachefile is not None:
+        scancache = loadscancache(scancachefile)
+
+    findsubmodulefunc = functools.partial(getsubmodules_local, filestoparsedict = filestoparsedict, submodulename1 = submodulename1, submodulename2 = submodulename2, scancache = scancache, workers = scanworkers, workertype = scanworkertype, scanbackend = scanbackend, skipbinary = skipbinary, maxfilesize = maxfilesize, includeglobs = includeglobs, excludeglobs = excludeglobs, usemanifest = usemanifest, submodulesavailable = getsubmodulesavailable(submodulepathdict, gitclonefunc = gitclonefunc), extrafilesdict = extrafilesdict)
+
+    # so I only create/fetch each mirror once
+    mirrordict = {}
+    if storepath is not None:
+        storeindex = loadstoreindex(storepath)
+    else:
+        storeindex = None
+    addsubmodulefunc = functools.partial(addsubmodules_local, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, gitclonelocal = gitclonelocal, rsync_gitskip = rsync_gitskip, usestamps = usestamps, revisiondict = revisiondict, storepath = storepath, linkmode = linkmode, storeindex = storeindex, readonly = readonly, syncbackend = syncbackend, trashdir = trashdir, mirrorcachedir = mirrorcachedir, mirrorrefresh = mirrorrefresh, clonemode = clonemode, clonedepth = clonedepth, clonefilter = clonefilter, mirrordict = mirrordict, lockentries = lockentries, gitclonefunc = gitclonefunc)
+
+    # parse the original version of each submodule in submodulepathdict rather than each copy
+    failures = dosubmodules(modulepathstodolist, findsubmodulefunc, addsubmodulefunc, submodulename1 = submodulename1, submodulename2 = submodulename2, modulescansearchlist = modulescansearchlist, printdetails = printdetails, submodulesourcefunc = submodulepathdict.get, workers = workers, trashdir = trashdir, cyclemode = cyclemode, maxnestingdepth = maxnestingdepth, collapsenested = collapsenested, staged = staged, expecteddict = expecteddict)
+
+    # the lockfile should have where the submodules are now rather than where they were built
+    if staged is True and lockentries is not None:
+        for modulepath in modulepathstodolist:
+            stagingpath = getstagingpath(modulepath)
+            for submodulepath in list(lockentries):
+                if submodulepath.startswith(stagingpath):
+                    lockentries[os.path.join(modulepath, submodulepath[len(stagingpath): ])] = lockentries.pop(submodulepath)
+
+    if scancachefile is not None:
+        savescancache(scancache, scancachefile)
+    if storepath is not None:
+        savestoreindex(storepath, storeindex)
+
+    # so deleting in the background doesn't outlast the run and any errors are reported
+    if trashdir is not None:
+        failures = failures + waitfortrash()
+
+    # only write lockfiles if everything worked since otherwise the next run needs to try again
+    if uselockfile is True and len(failures) == 0:
+        with tracephase('writelockfiles', 'phase'):
+            for modulepath in modulepathstodolist:
+                lock = getlockfile(modulepath, lockoptions, lockentries, submodulename1 = submodulename1, submodulename2 = submodulename2)
+                if lock is not None:
+                    writelockfile(modulepath, lock)
+
+    return(failures)
+
+
+# Workspace:{{{1
+def getgitprojects(rootfolder, submodulename1 = 'submodules', submodulename2 = 'submodules2'):
+    """
+    Get every git project in rootfolder (including rootfolder itself if it is a project).
+    I don't look inside projects for more projects so copies of submodules in submodules folders are never included.
+    Return a sorted list of paths ending in /.
+    """
+    projects = []
+    for root, dirs, files in os.walk(rootfolder):
+        if '.git' in dirs or '.git' in files:
+            projects.append(os.path.join(root, ''))
+            dirs.clear()
+            continue
+        # don't go into submodules folders or hidden folders
+        dirs[:] = sorted(d for d in dirs if d not in [submodulename1, submodulename2] and not d.startswith('.'))
+    return(sorted(projects))
+
+
+def getprojectsubmodulepathdict(projects):
+    """
+    Get submodulepathdict where each project is the source for the submodule with its name.
+    """
+    submodulepathdict = {}
+    for project in projects:
+        modulename = getmodulename(project)
+        if modulename in submodulepathdict:
+            print('Two projects with the same name so only using the first: ' + submodulepathdict[modulename] + ', ' + project + '.')
+            continue
+        submodulepathdict[modulename] = project
+    return(submodulepathdict)
+
+
+def allmodulesinfolder(rootfolder, urlpathstart = None, urlpathend = '', submodulename1 = 'submodules', submodulename2 = 'submodules2', printdetails = False, **kwargs):
+    """
+    Add the submodules for every git project in rootfolder in one run.
+
+    The projects are also the sources for the submodules so a submodule called x is copied from the project called x in rootfolder.
+    If there isn't a project called x and urlpathstart is given then x is git cloned from urlpathstart + x + urlpathend i.e. 'https://github.com/c-d-cotton/' + x + '.git'.
+
+    Everything is done in a single call of dosubmodules_local so there is one dependency graph, scan cache, store index and revisiondict for all the projects.
+    This means each project is parsed once and the revision of each source is only got once however many projects contain it.
+    kwargs are passed to dosubmodules_local i.e. workers, usestamps, uselockfile, scancachefile, storepath, syncbackend.
+
+    Return a list of [description, error] for any submodules that failed to be added.
+    """
+    projects = getgitprojects(rootfolder, submodulename1 = submodulename1, submodulename2 = submodulename2)
+    submodulepathdict = getprojectsubmodulepathdict(projects)
+
+    if urlpathstart is not None:
+        gitclonefunc = lambda submodule: urlpathstart + submodule + urlpathend
+    else:
+        gitclonefunc = None
+
+    if printdetails is True:
+        print(str(datetime.datetime.now()) + ': Projects found: ' + str(len(projects)) + '.')
+
+    failures = dosubmodules_local(projects, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, printdetails = printdetails, gitclonefunc = gitclonefunc, **kwargs)
+
+    return(failures)
+
+
+def allmodulesinfolder_ap(urlpathstart = None, urlpathend = ''):
+    """
+    Run allmodulesinfolder from the command line (see mysubmodules.cli.main).
+    """
+    from mysubmodules import cli
+
+    cli.main(urlpathstart = urlpathstart, urlpathend = urlpathend)
+
+
+# Status:{{{1
+def getexpectedsubmodules(modulepathstodolist, submodulepathdict, submodulename1 = 'submodules', submodulename2 = 'submodules2', uselockfile = True, **kwargs):
+    """
+    Get the copies of submodules each project in modulepathstodolist should have without changing anything.
+
+    If uselockfile is True and a project has a lockfile (see getlockfile), this is read from the lockfile.
+    Otherwise I go through the projects in the same way as dosubmodules_local without adding anything (see expecteddict in dosubmodules). kwargs are passed to dosubmodules_local so should be the options the submodules were added with (i.e. usemanifest, cyclemode, maxnestingdepth, collapsenested).
+
+    Return expecteddict where expecteddict[modulepath][submodulepath] = submodule. modulepath and submodulepath are absolute and end with /.
+    """
+    expecteddict = {}
+    toparse = []
+    for modulepath in modulepathstodolist:
+        modulepath = os.path.join(os.path.abspath(modulepath), '')
+        if uselockfile is True:
+            lock = readlockfile(modulepath)
+        else:
+            lock = None
+        if lock is not None:
+            expecteddict[modulepath] = {modulepath + relpath: lock['submodules'][relpath]['submodule'] for relpath in lock['submodules']}
+        else:
+            toparse.append(modulepath)
+
+    if len(toparse) > 0:
+        dosubmodules_local(toparse, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, expecteddict = expecteddict, **kwargs)
+
+    return(expecteddict)
+
+
+def getsubmodulesstatus(modulepathstodolist, submodulepathdict, submodulename1 = 'submodules', submodulename2 = 'submodules2', uselockfile = True, revisiondict = None, **kwargs):
+    """
+    Check the copies of submodules in the projects in modulepathstodolist without copying or changing anything.
+
+    The copies each project should have are got from its lockfile or by parsing the projects (see getexpectedsubmodules which kwargs are passed to).
+    Each copy is then checked against the stamp written when it was copied or cloned (see copysubmodule and clonesubmodulefromurl):
+    - 'missing': the copy isn't there
+    - 'extra': there is a folder in a submodules folder that shouldn't be there
+    - 'stale': the revision of the source (see getsourcerevision) is not the one the copy was made from
+    - 'modified': a file in the copy has been added, removed or changed since it was copied (by size and modification time compared with the snapshot saved with the stamp)
+    - 'unknown': the copy has no stamp or snapshot (i.e. it was added without usestamps or uselockfile) so I can't tell if it is stale or modified. This doesn't mean anything is wrong (see getsubmodulesproblems).
+    Submodules that were git cloned from a url are not checked for being stale since I would need to fetch from the url. Symlinks to other copies (see collapsenested in dosubmodules) are fine if they point to a copy that should be there.
+
+    revisiondict is as in getsourcerevision.
+    Return a list of [submodulepath, submodule, problem, details] for every problem found.
+    """
+    if revisiondict is None:
+        revisiondict = {}
+
+    expecteddict = getexpectedsubmodules(modulepathstodolist, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, uselockfile = uselockfile, **kwargs)
+
+    problems = []
+    for modulepath in expecteddict:
+        expected = expecteddict[modulepath]
+
+        # submodules folders to look for extra folders in
+        submodulesfolders = [os.path.join(modulepath, submodulename1), os.path.join(modulepath, submodulename2)]
+
+        for submodulepath in sorted(expected):
+            submodule = expected[submodulepath]
+            if os.path.islink(submodulepath[: -1]):
+                if os.path.join(os.path.realpath(submodulepath), '') not in expected:
+                    problems.append([submodulepath, submodule, 'extra', 'Symlink to a copy that should not be there: ' + os.readlink(submodulepath[: -1]) + '.'])
+                continue
+            if not os.path.isdir(submodulepath):
+                problems.append([submodulepath, submodule, 'missing', None])
+                continue
+            submodulesfolders.append(os.path.join(submodulepath, submodulename1))
+
+            stamp = readsubmodulestamp(submodulepath, snapshot = True)
+            if stamp is None:
+                problems.append([submodulepath, submodule, 'unknown', 'No stamp.'])
+                continue
+
+            # stale
+            if submodule in submodulepathdict:
+                sourcepath = submodulepathdict[submodule]
+                if stamp.get('source') != os.path.realpath(sourcepath):
+                    problems.append([submodulepath, submodule, 'stale', 'Copied from ' + str(stamp.get('source')) + ' rather than ' + os.path.realpath(sourcepath) + '.'])
+                else:
+                    if stamp.get('method') == 'gitclone':
+                        revision = getsourcerevision(sourcepath, includedirty = False, revisiondict = revisiondict)
+                    else:
+                        revision = getsourcerevision(sourcepath, includedirty = True, revisiondict = revisiondict, ignorenames = [submodulename1, submodulename2])
+                    if revision is None or revision != stamp.get('revision'):
+                        problems.append([submodulepath, submodule, 'stale', 'Source revision: ' + str(revision) + '. Copied revision: ' + str(stamp.get('revision')) + '.'])
+
+            # modified
+            if 'snapshot' not in stamp:
+                problems.append([submodulepath, submodule, 'unknown', 'No snapshot.'])
+                continue
+            snapshot = getsubmodulesnapshot(submodulepath, submodulename1 = submodulename1, submodulename2 = submodulename2)
+            if snapshot != stamp['snapshot']:
+                changedfiles = sorted(relpath for relpath in set(snapshot) | set(stamp['snapshot']) if snapshot.get(relpath) != stamp['snapshot'].get(relpath))
+                problems.append([submodulepath, submodule, 'modified', 'Files changed: ' + ', '.join(changedfiles[: 10]) + (', ...' if len(changedfiles) > 10 else '') + '.'])
+
+        # extra
+        for submodulesfolder in submodulesfolders:
+            if not os.path.isdir(submodulesfolder):
+                continue
+            for name in sorted(os.listdir(submodulesfolder)):
+                submodulepath = os.path.join(submodulesfolder, name, '')
+                if submodulepath in expected:
+                    continue
+                # a symlink to a copy that should be there is fine
+                if os.path.islink(submodulepath[: -1]) and os.path.join(os.path.realpath(submodulepath), '') in expected:
+                    continue
+                problems.append([submodulepath, name, 'extra', None])
+
+    return(problems)
+
+
+def getsubmodulesproblems(problems):
+    """
+    Get the problems from getsubmodulesstatus that are definitely wrong i.e. leave out the copies that are 'unknown'.
+    """
+    return([problem for problem in problems if problem[2] != 'unknown'])
+
+
+def printsubmodulesstatus(problems):
+    for submodulepath, submodule, problem, details in problems:
+        if details is None:
+            print(problem + ': ' + submodulepath)
+        else:
+            print(problem + ': ' + submodulepath + ' ' + details)
+    realproblems = getsubmodulesproblems(problems)
+    unknown = len(problems) - len(realproblems)
+    if unknown > 0:
+        print(str(unknown) + ' submodules could not be checked since they have no stamp (add them with usestamps or uselockfile).')
+    if len(realproblems) > 0:
+        print(str(len(realproblems)) + ' problems found.')
+    elif unknown == 0:
+        print('All submodules match their sources.')
+    else:
+        print('No problems found.')
+
+
+def statusmodulesinfolder(rootfolder, submodulename1 = 'submodules', submodulename2 = 'submodules2', **kwargs):
+    """
+    Run getsubmodulesstatus for every git project in rootfolder where the projects are also the sources (as in allmodulesinfolder).
+    kwargs are passed to getsubmodulesstatus.
+    """
+    projects = getgitprojects(rootfolder, submodulename1 = submodulename1, submodulename2 = submodulename2)
+    submodulepathdict = getprojectsubmodulepathdict(projects)
+    return(getsubmodulesstatus(projects, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, **kwargs))
+
+
+# Watch:{{{1
+def getsubmoduleconsumers(modulepathstodolist, submodulename1 = 'submodules', submodulename2 = 'submodules2'):
+    """
+    Find every copy of a submodule in the projects in modulepathstodolist (including copies inside copies).
+    Return consumers where consumers[submodule] is a list of the paths of the copies of submodule (ending in /).
+    Symlinks are skipped since they already point at the source.
+    """
+    consumers = {}
+    todo = [os.path.join(modulepath, '') for modulepath in modulepathstodolist]
+    while len(todo) > 0:
+        modulepath = todo.pop()
+        for submodulename in [submodulename1, submodulename2]:
+            thispath = os.path.join(modulepath, submodulename)
+            if os.path.islink(thispath) or not os.path.isdir(thispath):
+                continue
+            for submodule in sorted(os.listdir(thispath)):
+                submodulepath = os.path.join(thispath, submodule, '')
+                if os.path.islink(submodulepath[: -1]) or not os.path.isdir(submodulepath):
+                    continue
+                if submodule not in consumers:
+                    consumers[submodule] = []
+                consumers[submodule].append(submodulepath)
+                todo.append(submodulepath)
+    return(consumers)
+
+
+def getwatchexcludepatterns(submodulename1 = 'submodules', submodulename2 = 'submodules2'):
+    """
+    Patterns (as in isrsyncexcluded) for files in a source that the watch mode ignores: the submodules folders, .git/, stamps and lockfiles.
+    """
+    return(getsubmoduleexcludepatterns(submodulename1 = submodulename1, submodulename2 = submodulename2, rsync_gitskip = False) + ['.git', '/' + stampfilename_default, '/' + lockfilename_default])
+
+
+def getpollsnapshot(sourcepath, excludepatterns):
+    """
+    Get snapshot[relpath] = [mode, size, mtime] for everything in sourcepath that isn't excluded so I can find changes by polling.
+    """
+    snapshot = {}
+    todo = ['']
+    while len(todo) > 0:
+        reldir = todo.pop()
+        try:
+            with os.scandir(os.path.join(sourcepath, reldir)) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            relpath = os.path.join(reldir, entry.name)
+            isdir = entry.is_dir(follow_symlinks = False)
+            if isrsyncexcluded(relpath, isdir, excludepatterns):
+                continue
+            try:
+                st = entry.stat(follow_symlinks = False)
+            except OSError:
+                continue
+            snapshot[relpath] = [st.st_mode, st.st_size, st.st_mtime_ns]
+            if isdir:
+                todo.append(relpath)
+    return(snapshot)
+
+
+def startinotify():
+    """
+    Start an inotify instance with ctypes. Return None if inotify isn't available (i.e. not on Linux) so I need to poll.
+    """
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return(None)
+
+    # IN_NONBLOCK | IN_CLOEXEC
+    fd = libc.inotify_init1(0o4000 | 0o2000000)
+    if fd < 0:
+        return(None)
+
+    # watchstate['wds'][wd] = [sourcepath, reldir]
+    watchstate = {'libc': libc, 'fd': fd, 'wds': {}}
+    return(watchstate)
+
+
+def addinotifywatches(watchstate, sourcepath, reldir, excludepatterns):
+    """
+    Watch the folder reldir in sourcepath and every folder in it that isn't excluded.
+    Return the relpaths of everything found so they can be treated as changed if the folder is new.
+    """
+    import ctypes
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    mask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+    found = []
+    todo = [reldir]
+    while len(todo) > 0:
+        reldir = todo.pop()
+        wd = watchstate['libc'].inotify_add_watch(watchstate['fd'], os.fsencode(os.path.join(sourcepath, reldir)), ctypes.c_uint32(mask))
+        if wd < 0:
+            continue
+        watchstate['wds'][wd] = [sourcepath, reldir]
+        try:
+            with os.scandir(os.path.join(sourcepath, reldir)) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            relpath = os.path.join(reldir, entry.name)
+            isdir = entry.is_dir(follow_symlinks = False)
+            if isrsyncexcluded(relpath, isdir, excludepatterns):
+                continue
+            found.append(relpath)
+            if isdir:
+                todo.append(relpath)
+    return(found)
+
+
+def readinotifyevents(watchstate, timeout, excludepatterns, debounce = 0.05):
+    """
+    Wait up to timeout seconds for changes and then keep reading until nothing has happened for debounce seconds so a save that touches several files is handled together.
+    Return changes where changes[sourcepath] is a set of changed relpaths or None if events were lost (IN_Q_OVERFLOW) so everything needs to be checked.
+    """
+    import select
+    import struct
+
+    changes = {}
+    thistimeout = timeout
+    while True:
+        ready, _, _ = select.select([watchstate['fd']], [], [], thistimeout)
+        if len(ready) == 0:
+            return(changes)
+        try:
+            data = os.read(watchstate['fd'], 1024 * 1024)
+        except BlockingIOError:
+            continue
+        thistimeout = debounce
+
+        position = 0
+        while position + 16 <= len(data):
+            wd, mask, cookie, namelength = struct.unpack_from('iIII', data, position)
+            name = os.fsdecode(data[position + 16: position + 16 + namelength].rstrip(b'\0'))
+            position = position + 16 + namelength
+
+            # IN_Q_OVERFLOW
+            if mask & 0x4000:
+                return(None)
+            if wd not in watchstate['wds']:
+                continue
+            sourcepath, reldir = watchstate['wds'][wd]
+            # IN_IGNORED i.e. the folder was deleted
+            if mask & 0x8000:
+                del watchstate['wds'][wd]
+                continue
+            if name == '':
+                continue
+            relpath = os.path.join(reldir, name)
+            # IN_ISDIR
+            isdir = mask & 0x40000000 != 0
+            if isrsyncexcluded(relpath, isdir, excludepatterns):
+                continue
+            if sourcepath not in changes:
+                changes[sourcepath] = set()
+            changes[sourcepath].add(relpath)
+            # new folder (IN_CREATE or IN_MOVED_TO) so watch it and everything in it
+            if isdir and mask & (0x100 | 0x80):
+                changes[sourcepath].update(addinotifywatches(watchstate, sourcepath, relpath, excludepatterns))
+
+
+def applysourcechanges(sourcepath, relpaths, consumerpaths, readonly = False, submodulename1 = 'submodules', submodulename2 = 'submodules2'):
+    """
+    Copy the files relpaths from sourcepath to each of consumerpaths (or delete them if they no longer exist in sourcepath).
+    Files are copied with copyfilenative so unchanged files are skipped.
+    The stamp and snapshot of each copy that has a stamp are then written again (as in copysubmodule) so getsubmodulesstatus doesn't report the copy as stale or modified.
+    Return the number of files copied or deleted.
+    """
+    import stat
+
+    if readonly is True:
+        filemode = 0o555
+    else:
+        filemode = None
+
+    changed = 0
+    # do parents before children so folders exist before their files
+    for relpath in sorted(relpaths):
+        sourcefile = os.path.join(sourcepath, relpath)
+        try:
+            sourcestat = os.lstat(sourcefile)
+        except FileNotFoundError:
+            sourcestat = None
+
+        for consumerpath in consumerpaths:
+            destfile = os.path.join(consumerpath, relpath)
+            destdir = os.path.dirname(destfile)
+            if sourcestat is not None and not os.path.isdir(destdir):
+                # the folder is created when its own change is handled unless it was excluded
+                continue
+            if sourcestat is None and not os.path.lexists(destfile):
+                continue
+
+            # copies may be read only
+            dirmode = None
+            if os.path.isdir(destdir) and not os.access(destdir, os.W_OK):
+                dirmode = stat.S_IMODE(os.stat(destdir).st_mode)
+                os.chmod(destdir, 0o755)
+            try:
+                try:
+                    deststat = os.lstat(destfile)
+                except FileNotFoundError:
+                    deststat = None
+
+                if sourcestat is None:
+                    rmrecursive(destfile)
+                    changed = changed + 1
+                elif stat.S_ISLNK(sourcestat.st_mode):
+                    linkto = os.readlink(sourcefile)
+                    if deststat is None or not stat.S_ISLNK(deststat.st_mode) or os.readlink(destfile) != linkto:
+                        if deststat is not None:
+                            rmrecursive(destfile)
+                        os.symlink(linkto, destfile)
+                        changed = changed + 1
+                elif stat.S_ISDIR(sourcestat.st_mode):
+                    if deststat is not None and not stat.S_ISDIR(deststat.st_mode):
+                        rmrecursive(destfile)
+                        deststat = None
+                    if deststat is None:
+                        os.mkdir(destfile)
+                        if readonly is True:
+                            os.chmod(destfile, 0o555)
+                        else:
+                            os.chmod(destfile, stat.S_IMODE(sourcestat.st_mode))
+                        changed = changed + 1
+                elif stat.S_ISREG(sourcestat.st_mode):
+                    if deststat is not None and stat.S_ISDIR(deststat.st_mode):
+                        rmrecursive(destfile)
+                        deststat = None
+                    if copyfilenative(sourcefile, sourcestat, destfile, deststat, filemode = filemode) is not None:
+                        changed = changed + 1
+            except FileNotFoundError:
+                # the source changed again while I was copying it so it will come up in the next batch of changes
+                pass
+            finally:
+                if dirmode is not None:
+                    os.chmod(destdir, dirmode)
+
+    # so I only get the revision of sourcepath once
+    revisiondict = {}
+    for consumerpath in consumerpaths:
+        oldstamp = readsubmodulestamp(consumerpath)
+        if oldstamp is None or oldstamp.get('method') not in ['rsync', 'store']:
+            continue
+        stamp = getsubmodulestamp(sourcepath, oldstamp['method'], oldstamp['options'], revisiondict = revisiondict, ignorenames = [submodulename1, submodulename2])
+        if stamp is not None:
+            writesubmodulestamp(consumerpath, stamp, snapshot = getsubmodulesnapshot(consumerpath, submodulename1 = submodulename1, submodulename2 = submodulename2))
+
+    return(changed)
+
+
+def watchsubmodules_local(modulepathstodolist, submodulepathdict, usepolling = False, interval = 0.5, maxiterations = None, submodulename1 = 'submodules', submodulename2 = 'submodules2', readonly = False, usemanifest = False, filestoparsedict = None, printdetails = False, **kwargs):
+    """
+    Keep the submodules in modulepathstodolist up to date with their sources until interrupted.
+
+    First run dosubmodules_local. Then watch the sources of the copied submodules (and the projects in modulepathstodolist) with inotify or by polling every interval seconds if inotify isn't available or usepolling is True.
+    When files in a source change, only these files are copied to (or deleted from) each copy of the source found by getsubmoduleconsumers.
+    If the submodules referred to by a changed module change, dosubmodules_local is run again for the projects containing copies of it so its dependencies are resolved again. This only needs to parse the changed files since the scan cache is kept between runs and only copies the submodules whose source changed since usestamps is always True.
+    Changed files that git doesn't list yet (i.e. new files that haven't been added) are parsed as well (see getsubmodules_local with extrafilesdict).
+
+    Changes in .git/ are not copied so this can't be used with gitclonelocal. If inotify loses events then dosubmodules_local is run again for everything.
+    maxiterations stops watching after this many checks for changes (mainly for testing).
+    kwargs are passed to dosubmodules_local. The options for parsing files (i.e. scanbackend, skipbinary, maxfilesize, includeglobs, excludeglobs, scanworkers and scanworkertype) are also used when checking whether the submodules of a changed module have changed.
+    """
+    import time
+
+    if kwargs.get('gitclonelocal') is True:
+        raise ValueError('watchsubmodules_local copies files so does not work with gitclonelocal.')
+
+    modulepathstodolist = [os.path.join(modulepath, '') for modulepath in modulepathstodolist]
+    excludepatterns = getwatchexcludepatterns(submodulename1 = submodulename1, submodulename2 = submodulename2)
+    # kept between runs so checking for changed submodules only parses changed files
+    scancache = kwargs.pop('scancache', None)
+    if scancache is None:
+        scancache = loadscancache(kwargs.get('scancachefile'))
+    # files given to parse as well as the changed files below
+    givenextrafilesdict = kwargs.pop('extrafilesdict', None)
+    # the same as in dosubmodules_local so the watch finds the same submodules as the runs
+    findsubmodulefunc = functools.partial(getsubmodules_local, submodulename1 = submodulename1, submodulename2 = submodulename2, filestoparsedict = filestoparsedict, scancache = scancache, workers = kwargs.get('scanworkers'), workertype = kwargs.get('scanworkertype', 'thread'), scanbackend = kwargs.get('scanbackend', scanbackend_default), skipbinary = kwargs.get('skipbinary', False), maxfilesize = kwargs.get('maxfilesize'), includeglobs = kwargs.get('includeglobs'), excludeglobs = kwargs.get('excludeglobs'), usemanifest = usemanifest, submodulesavailable = getsubmodulesavailable(submodulepathdict, gitclonefunc = kwargs.get('gitclonefunc')))
+    # changedfiles[sourcepath] is every file that has changed in sourcepath while watching
+    # git ls-files doesn't list new files until they are added so I parse these as well
+    changedfiles = {}
+
+    def getextrafilesdict():
+        if givenextrafilesdict is not None:
+            extrafilesdict = {modulename: list(givenextrafilesdict[modulename]) for modulename in givenextrafilesdict}
+        else:
+            extrafilesdict = {}
+        for sourcepath in changedfiles:
+            files = [os.path.join(sourcepath, relpath) for relpath in sorted(changedfiles[sourcepath])]
+            modulename = os.path.basename(sourcepath[: -1])
+            extrafilesdict[modulename] = extrafilesdict.get(modulename, []) + [filename for filename in files if os.path.isfile(filename) and not os.path.islink(filename)]
+        return(extrafilesdict)
+
+    # stamps are always written so running again only copies the submodules whose source has changed
+    kwargs['usestamps'] = True
+
+    def dorun(projects):
+        failures = dosubmodules_local(projects, submodulepathdict, submodulename1 = submodulename1, submodulename2 = submodulename2, readonly = readonly, usemanifest = usemanifest, filestoparsedict = filestoparsedict, printdetails = printdetails, scancache = scancache, extrafilesdict = getextrafilesdict(), **kwargs)
+        consumers = getsubmoduleconsumers(modulepathstodolist, submodulename1 = submodulename1, submodulename2 = submodulename2)
+        # sourcesdict[sourcepath] = copies of sourcepath
+        # projects are watched as well since their submodules may change
+        sourcesdict = {}
+        for project in modulepathstodolist:
+            sourcesdict[os.path.realpath(project) + '/'] = []
+        for submodule in consumers:
+            if submodule in submodulepathdict:
+                sourcesdict[os.path.realpath(submodulepathdict[submodule]) + '/'] = consumers[submodule]
+        return(failures, sourcesdict)
+
+    def getreferences(sourcepath):
+        try:
+            return(findsubmodulefunc(sourcepath, extrafilesdict = getextrafilesdict()))
+        except Exception:
+            return(None)
+
+    failures, sourcesdict = dorun(modulepathstodolist)
+    references = {sourcepath: getreferences(sourcepath) for sourcepath in sourcesdict}
+
+    if usepolling is True:
+        watchstate = None
+    else:
+        watchstate = startinotify()
+    def startwatching():
+        if watchstate is None:
+            return({sourcepath: getpollsnapshot(sourcepath, excludepatterns) for sourcepath in sourcesdict})
+        # start again with no watches
+        for wd in list(watchstate['wds']):
+            watchstate['libc'].inotify_rm_watch(watchstate['fd'], wd)
+        watchstate['wds'].clear()
+        for sourcepath in sourcesdict:
+            addinotifywatches(watchstate, sourcepath, '', excludepatterns)
+        return(None)
+    snapshots = startwatching()
+
+    if printdetails is True:
+        if watchstate is None:
+            print(str(datetime.datetime.now()) + ': Watching by polling: ' + str(len(sourcesdict)) + ' folders.')
+        else:
+            print(str(datetime.datetime.now()) + ': Watching with inotify: ' + str(len(sourcesdict)) + ' folders.')
+
+    iteration = 0
+    try:
+        while maxiterations is None or iteration < maxiterations:
+            iteration = iteration + 1
+
+            if watchstate is None:
+                time.sleep(interval)
+                changes = {}
+                for sourcepath in sourcesdict:
+                    newsnapshot = getpollsnapshot(sourcepath, excludepatterns)
+                    changed = set(relpath for relpath in set(newsnapshot) | set(snapshots[sourcepath]) if newsnapshot.get(relpath) != snapshots[sourcepath].get(relpath))
+                    snapshots[sourcepath] = newsnapshot
+                    if len(changed) > 0:
+                        changes[sourcepath] = changed
+            else:
+                changes = readinotifyevents(watchstate, interval, excludepatterns)
+
+            if changes is None:
+                # lost events so do everything again
+                print('Watch lost events so running everything again.')
+                failures, sourcesdict = dorun(modulepathstodolist)
+                references = {sourcepath: getreferences(sourcepath) for sourcepath in sourcesdict}
+                snapshots = startwatching()
+                continue
+
+            rerunprojects = set()
+            for sourcepath in changes:
+                if sourcepath not in changedfiles:
+                    changedfiles[sourcepath] = set()
+                changedfiles[sourcepath].update(changes[sourcepath])
+
+                consumerpaths = sourcesdict[sourcepath]
+                changed = applysourcechanges(sourcepath, changes[sourcepath], consumerpaths, readonly = readonly, submodulename1 = submodulename1, submodulename2 = submodulename2)
+                if printdetails is True:
+                    print(str(datetime.datetime.now()) + ': Changed: ' + sourcepath + '. Files: ' + str(len(changes[sourcepath])) + '. Copied: ' + str(changed) + '.')
+
+                newreferences = getreferences(sourcepath)
+                if newreferences != references[sourcepath]:
+                    references[sourcepath] = newreferences
+                    # the projects containing a copy of this module (or the project itself)
+                    for project in modulepathstodolist:
+                        if os.path.realpath(project) + '/' == sourcepath or any(consumerpath.startswith(project) for consumerpath in consumerpaths):
+                            rerunprojects.add(project)
+
+            if len(rerunprojects) > 0:
+                if printdetails is True:
+                    print(str(datetime.datetime.now()) + ': Submodules changed so running again: ' + ', '.join(sorted(rerunprojects)) + '.')
+                thisfailures, newsourcesdict = dorun(sorted(rerunprojects))
+                failures = failures + thisfailures
+                for sourcepath in newsourcesdict:
+                    if sourcepath not in references:
+                        references[sourcepath] = getreferences(sourcepath)
+                sourcesdict = newsourcesdict
+                snapshots = startwatching()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watchstate is not None:
+            os.close(watchstate['fd'])
+
+    return(failures)
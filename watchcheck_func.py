@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# PYTHON_PREAMBLE_START_COPYRIGHT:{{{
+# Christopher David Cotton (c)
+# http://www.cdcotton.com
+# PYTHON_PREAMBLE_END:}}}
+
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from mysubmodules import core
+
+# Local Projects:{{{1
+def makeproject(rootfolder, name, text):
+    """
+    Make a git project at rootfolder/name/ with one commit containing main.py with text.
+    """
+    modulepath = os.path.join(rootfolder, name, '')
+    os.makedirs(modulepath)
+    with open(os.path.join(modulepath, 'main.py'), 'w') as f:
+        f.write(text)
+    subprocess.check_call(['git', 'init', '--quiet'], cwd = modulepath)
+    subprocess.check_call(['git', 'add', '-A'], cwd = modulepath)
+    subprocess.check_call(['git', '-c', 'user.name=watchcheck', '-c', 'user.email=watchcheck@example.com', 'commit', '--quiet', '-m', 'Version 0.'], cwd = modulepath)
+    return(modulepath)
+
+
+# Checks:{{{1
+def checkwatchstatus(rootfolder, interval = 0.2):
+    """
+    Watch a project p with a submodule a, change a file in a while watching and then check getsubmodulesstatus finds no problems.
+    """
+    sourcepath = makeproject(rootfolder, 'a', 'Version 0.\n')
+    projectpath = makeproject(rootfolder, 'p', "sys.path.append('submodules/a/')\n")
+    submodulepathdict = {'a': sourcepath}
+    copypath = os.path.join(projectpath, 'submodules', 'a', '')
+
+    failures = []
+    def watch():
+        failures.extend(core.watchsubmodules_local([projectpath], submodulepathdict, usepolling = True, interval = interval, maxiterations = 10, syncbackend = 'native'))
+    thread = threading.Thread(target = watch)
+    thread.start()
+
+    # wait until the first run has finished and the watch has started
+    while thread.is_alive() and not os.path.isfile(os.path.join(copypath, core.stampfilename_default)):
+        time.sleep(0.01)
+    time.sleep(interval * 2)
+    with open(os.path.join(sourcepath, 'main.py'), 'w') as f:
+        f.write('Version 1.\n')
+    thread.join()
+
+    if len(failures) > 0:
+        raise ValueError('Watch failed: ' + str(failures) + '.')
+    with open(os.path.join(copypath, 'main.py')) as f:
+        if f.read() != 'Version 1.\n':
+            raise ValueError('Watch did not copy the change.')
+
+    problems = core.getsubmodulesstatus([projectpath], submodulepathdict)
+    if problems != []:
+        raise ValueError('Status after watch should be []: ' + str(problems) + '.')
+
+
+def runwatchchecks():
+    """
+    Run each check in its own temporary folder. Raise an error if any fail.
+    """
+    for check in [checkwatchstatus]:
+        rootfolder = tempfile.mkdtemp()
+        try:
+            check(rootfolder)
+        finally:
+            core.rmrecursive(rootfolder)
+        print(check.__name__ + ': passed.')
+
+
+# Run:{{{1
+if __name__ == '__main__':
+    runwatchchecks()